@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+import numpy as np
+import multiprocessing as mp
+from typing import List, Dict
+from Shared.Detection import Detection
+
+
+class BallTrack(object):
+    """
+    Constant velocity Kalman filter of the ball position in the 480x270 space of one camera.
+    State is (x, y, vx, vy), in pixels and pixels per second.
+    """
+    # Variance of the ball acceleration (pixels/s^2) and of the measured position (pixels)
+    ACCELERATION_VARIANCE: float = 400 ** 2
+    MEASUREMENT_VARIANCE: float = 4 ** 2
+    H = np.array([[1, 0, 0, 0], [0, 1, 0, 0]], dtype=np.float64)
+    # Number of values, in which the track is shared: state, covariance, timestamp, hits and misses
+    SIZE: int = 4 + 16 + 3
+
+    def __init__(self, x: float, y: float, timestamp: int):
+        self.state = np.array([x, y, 0, 0], dtype=np.float64)
+        self.covariance = np.diag([self.MEASUREMENT_VARIANCE, self.MEASUREMENT_VARIANCE, 200 ** 2, 200 ** 2])
+        self.timestamp = timestamp
+        self.hits = 1
+        self.misses = 0
+
+    def to_values(self) -> List[float]:
+        return list(self.state) + list(self.covariance.flat) + [self.timestamp, self.hits, self.misses]
+
+    @staticmethod
+    def from_values(values: List[float]) -> "BallTrack":
+        track = BallTrack(0, 0, int(values[20]))
+        track.state = np.array(values[0:4], dtype=np.float64)
+        track.covariance = np.array(values[4:20], dtype=np.float64).reshape((4, 4))
+        track.hits = int(values[21])
+        track.misses = int(values[22])
+        return track
+
+    def predict(self, timestamp: int) -> (np.ndarray, np.ndarray):
+        # Prediction at the given monotonic time (ms), without changing the track
+        dt = max(timestamp - self.timestamp, 0) / 1000
+        f = np.array([[1, 0, dt, 0], [0, 1, 0, dt], [0, 0, 1, 0], [0, 0, 0, 1]], dtype=np.float64)
+        g = np.array([[dt * dt / 2, 0], [0, dt * dt / 2], [dt, 0], [0, dt]], dtype=np.float64)
+        return f @ self.state, f @ self.covariance @ f.T + g @ g.T * self.ACCELERATION_VARIANCE
+
+    def distance(self, x: float, y: float, timestamp: int) -> float:
+        # Squared Mahalanobis distance of the measurement from the prediction
+        state, covariance = self.predict(timestamp)
+        innovation = np.array([x, y]) - self.H @ state
+        s = self.H @ covariance @ self.H.T + np.eye(2) * self.MEASUREMENT_VARIANCE
+        return float(innovation @ np.linalg.solve(s, innovation))
+
+    def update(self, x: float, y: float, timestamp: int):
+        state, covariance = self.predict(timestamp)
+        innovation = np.array([x, y]) - self.H @ state
+        s = self.H @ covariance @ self.H.T + np.eye(2) * self.MEASUREMENT_VARIANCE
+        gain = covariance @ self.H.T @ np.linalg.inv(s)
+        self.state = state + gain @ innovation
+        self.covariance = (np.eye(4) - gain @ self.H) @ covariance
+        self.timestamp = timestamp
+        self.hits += 1
+        self.misses = 0
+
+
+class BallTracker(object):
+    """
+    Keeps one ball track per camera, between the sparse detections. Detections are associated with the track
+    through the Mahalanobis gate, so that the detections far from the tracked ball don't switch the camera.
+    Confirmed track also gives the region of interest, to which the next detection of the camera is restricted.
+    Tracks are optionally published to the shared array, from which the detector workers load them.
+    """
+    # Chi-square value of two degrees of freedom at 99%
+    GATE: float = 9.21
+    # Track is confirmed after this many detections, and replaced after this many detections outside the gate
+    CONFIRMED_HITS: int = 3
+    MAX_MISSES: int = 2
+
+    def __init__(self, max_age: float, use_roi: bool, shared_tracks: mp.Array = None, width: int = 480,
+                 height: int = 270):
+        self.max_age = max_age
+        self.use_roi = use_roi
+        self.shared_tracks = shared_tracks
+        self.width = width
+        self.height = height
+        self.tracks: Dict[int, BallTrack] = {}
+
+    @staticmethod
+    def create_shared_tracks(number_of_cameras: int) -> mp.Array:
+        return mp.Array("d", number_of_cameras * BallTrack.SIZE)
+
+    def save(self, camera_id: int):
+        # Camera without the track is published with zero hits
+        if self.shared_tracks is None:
+            return
+        track = self.tracks.get(camera_id)
+        values = track.to_values() if track is not None else [0] * BallTrack.SIZE
+        start = (camera_id - 1) * BallTrack.SIZE
+        with self.shared_tracks.get_lock():
+            self.shared_tracks.get_obj()[start:start + BallTrack.SIZE] = values
+
+    def load(self):
+        if self.shared_tracks is None:
+            return
+        with self.shared_tracks.get_lock():
+            values = list(self.shared_tracks.get_obj())
+        self.tracks = {}
+        for i in range(len(values) // BallTrack.SIZE):
+            track_values = values[i * BallTrack.SIZE:(i + 1) * BallTrack.SIZE]
+            if track_values[21] > 0:
+                self.tracks[i + 1] = BallTrack.from_values(track_values)
+
+    def get_track(self, camera_id: int, timestamp: int) -> BallTrack:
+        track = self.tracks.get(camera_id)
+        if track is not None and timestamp - track.timestamp > self.max_age * 1000:
+            # Ball has been lost for too long
+            del self.tracks[camera_id]
+            track = None
+        return track
+
+    def update(self, camera_id: int, balls: List[Detection], timestamp: int) -> List[Detection]:
+        """
+        Returns the balls which should be considered, the one associated with the track first.
+        While the track is confirmed, the balls outside the gate are ignored.
+        """
+        balls = self.associate(camera_id, balls, timestamp)
+        self.save(camera_id)
+        return balls
+
+    def associate(self, camera_id: int, balls: List[Detection], timestamp: int) -> List[Detection]:
+        track = self.get_track(camera_id, timestamp)
+        if len(balls) == 0:
+            return balls
+
+        if track is not None:
+            distances = [track.distance(*self.get_centre(b), timestamp) for b in balls]
+            best = int(np.argmin(distances))
+            if distances[best] <= self.GATE:
+                track.update(*self.get_centre(balls[best]), timestamp)
+                others = [] if track.hits >= self.CONFIRMED_HITS else balls[:best] + balls[best + 1:]
+                return [balls[best]] + others
+            if track.hits >= self.CONFIRMED_HITS:
+                # Ball seen elsewhere repeatedly, means that the tracked ball is gone
+                track.misses += 1
+                if track.misses < self.MAX_MISSES:
+                    return []
+
+        # New track starts from the most confident ball
+        ball = max(balls, key=lambda b: b.confidence)
+        self.tracks[camera_id] = BallTrack(*self.get_centre(ball), timestamp)
+        return [ball] + [b for b in balls if b is not ball]
+
+    def get_roi(self, camera_id: int, timestamp: int) -> tuple:
+        # Region (left, top, right, bottom) around the predicted position of the confirmed track
+        track = self.get_track(camera_id, timestamp)
+        if not self.use_roi or track is None or track.hits < self.CONFIRMED_HITS:
+            return None
+
+        state, covariance = track.predict(timestamp)
+        half_width = max(3 * np.sqrt(covariance[0, 0]), self.width / 10)
+        half_height = max(3 * np.sqrt(covariance[1, 1]), self.height / 10)
+        left = int(max(state[0] - half_width, 0))
+        top = int(max(state[1] - half_height, 0))
+        right = int(min(state[0] + half_width, self.width))
+        bottom = int(min(state[1] + half_height, self.height))
+        if right - left < 16 or bottom - top < 16:
+            return None
+        return left, top, right, bottom
+
+    @staticmethod
+    def get_centre(ball: Detection) -> (float, float):
+        return ball.left + ball.width / 2, ball.top + ball.height / 2
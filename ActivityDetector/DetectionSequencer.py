@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+import time
+import heapq
+import numpy as np
+from typing import List
+from Shared.CapturedFrame import SharedCapturedFrame
+
+
+class DetectionSequencer(object):
+    """
+    Puts the results of the detector workers back into the order of the frame timestamps.
+    The result is held until enough later results have arrived (depth), or until it has waited for the timeout,
+    so that the camera switching decisions don't depend on which worker finished first.
+    """
+    def __init__(self, depth: int, timeout: float):
+        self.depth = depth
+        self.timeout = timeout
+        self.heap = []
+        self.counter = 0
+
+    def push(self, shared_captured_frame: SharedCapturedFrame, detections: np.ndarray):
+        # Counter keeps the order of the results with the same timestamp
+        self.counter += 1
+        heapq.heappush(self.heap, (shared_captured_frame.timestamp, self.counter, time.monotonic(),
+                                   shared_captured_frame, detections))
+
+    def pop_ready(self, flush: bool = False) -> List[tuple]:
+        ready = []
+        now = time.monotonic()
+        while len(self.heap) > 0 and (flush or len(self.heap) > self.depth or now - self.heap[0][2] >= self.timeout):
+            timestamp, counter, received_at, shared_captured_frame, detections = heapq.heappop(self.heap)
+            ready.append((shared_captured_frame, detections))
+        return ready
+
+    def __len__(self):
+        return len(self.heap)
@@ -3,166 +3,110 @@ import cv2
 import time
 import numpy as np
 import os
-import copy
 import multiprocessing as mp
 import threading
+import queue
 from typing import List
-from Shared.CapturedFrame import CapturedFrame, SharedCapturedFrameHandler as sch
+from Shared.CapturedFrame import CapturedFrame, SharedCapturedFrame, SharedCapturedFrameHandler as sch
+from Shared.SharedFrameRing import SharedFrameRing
 from Shared.Camera import Camera
 from Shared.Detection import Detection
-from Shared.Linq import Linq
 from Shared.SharedFunctions import SharedFunctions
 from Shared.DefinedPolygon import DefinedPolygon
-from Darknet.DarknetDetector import DarknetDetector
+from Shared.ZoneMask import ZoneMask
+from ActivityDetector.BallTracker import BallTracker
+from ActivityDetector.DetectionSequencer import DetectionSequencer
 from Shared.RecordScreenInfo import RecordScreenInfo
 from Shared.RecordScreenInfoEventItem import RecordScreenInfoEventItem
 from Shared.RecordScreenInfoOperation import RecordScreenInfoOperation
 
 
 class Detector(object):
+    """
+    Makes the camera switching decisions from the detections of the detector workers,
+    which are reordered by the frame timestamps first.
+    """
+    # How long the detector blocks on the empty queue, before it checks if it should exit
+    QUEUE_TIMEOUT: float = 0.5
+    # How long the result waits for the results of the earlier frames, from the other workers
+    SEQUENCE_TIMEOUT: float = 0.5
+
     def __init__(self, playground: int,
-                 ai_frame_queue: mp.Queue, detection_queues: List[mp.Queue], screen_queue: mp.Queue,
-                 class_id: int, network_config_path: str, network_weights_path: str,
-                 coco_config_path: str, width: int, height: int,
+                 result_queue: mp.Queue, detection_queues: List[mp.Queue], screen_queue: mp.Queue,
+                 width: int, height: int,
                  cameras: List[Camera], polygons: List[DefinedPolygon], number_of_cameras: int,
+                 frame_rings: List[SharedFrameRing], workers: int, batch_size: int,
+                 last_detections: mp.Array, shared_tracks: mp.Array, track_max_age: float, track_roi: bool,
                  debugging: bool):
         self.playground = playground
-        self.ai_frame_queue = ai_frame_queue
+        self.result_queue = result_queue
+        self.frame_rings = frame_rings
         self.detection_queues = detection_queues
         self.screen_queue = screen_queue
 
-        self.class_id = class_id
-        self.network_config_path = network_config_path
-        self.network_weights_path = network_weights_path
-        self.coco_config_path = coco_config_path
         self.width = width
         self.height = height
         self.cameras = cameras
         self.polygons = polygons
+        # Polygons are rasterised once, so that each ball is checked in constant time
+        self.zone_mask = ZoneMask(polygons)
         self.number_of_cameras_to_process = number_of_cameras
+        self.workers = workers
+        # With a single worker, the results already arrive in order
+        self.sequencer = DetectionSequencer((workers - 1) * batch_size, self.SEQUENCE_TIMEOUT)
+        # Monotonic time of the last ball detected in the area of each camera, which drives the sampling rate
+        self.last_detections = last_detections
+        # Ball is tracked between the detections of each camera, and the tracks are shared with the workers
+        self.tracker = BallTracker(track_max_age, track_roi, shared_tracks)
         self.debugging = debugging
 
         self.active_camera = cameras[0]
+        self.last_camera_swapping = time.time() - 2
 
         # Logger
         self.total_detections = 0
         self.detection_started = time.time()
+        self.ball_sizes: List[Detection] = []
 
     def start(self):
-        # load the object detection network
-        net: DarknetDetector = DarknetDetector(self.network_config_path,
-                                               self.network_weights_path,
-                                               self.coco_config_path,
-                                               (self.cameras[0].width, self.cameras[0].height))
-
         self.detection_started = time.time()
 
         try:
-            ball_sizes: List[Detection] = []
-
-            warmed_up = False
             last_job = time.time()
-            last_camera_swapping = time.time() - 2
-            while True:
-                # We only proceed, if there is anything in the active camera queue
-                if self.ai_frame_queue.qsize() > 0:
-                    shared_captured_frame = self.ai_frame_queue.get()
+            finished_workers = 0
+            while finished_workers < self.workers:
+                try:
+                    result = self.result_queue.get(timeout=self.QUEUE_TIMEOUT)
+                    received = True
+                except queue.Empty:
+                    received = False
+
+                if received:
                     last_job = time.time()
-                    warmed_up = True
-
-                    # We are stopping detection if we have reached the end of the queue for all cameras
-                    if shared_captured_frame is not None:
-                        captured_frame = sch.get_frame(shared_captured_frame)
-                        # Run the AI detection, based on class id
-                        print("Detecting frame from camera {}".format(captured_frame.camera.id))
-                        detections = net.detect(captured_frame.frame, True)
-                        self.total_detections += 1
-                        detections_per_second = (self.total_detections / (time.time() - self.detection_started))
+
+                    # Each worker signals its end with None
+                    if result is None:
+                        finished_workers += 1
+                    else:
+                        self.sequencer.push(*result)
+                else:
+                    # This ensures, that this process exits, if the workers' end got lost,
+                    # and there was no result for 10 seconds after the end of capture.
+                    if SharedFunctions.is_idle(last_job, self.cameras[0].end_of_capture, 10):
                         self.screen_queue.put_nowait(
-                            [RecordScreenInfoEventItem(RecordScreenInfo.AI_DETECTIONS_PER_SECOND,
+                            [RecordScreenInfoEventItem(RecordScreenInfo.CURRENT_TASK,
                                                        RecordScreenInfoOperation.SET,
-                                                       detections_per_second)])
-
-                        # Convert detections into balls
-                        balls = []
-                        for detection in detections:
-                            if detection.ClassID == self.class_id:
-                                balls.append(Detection(int(detection.Left),
-                                                       int(detection.Right),
-                                                       int(detection.Top),
-                                                       int(detection.Bottom),
-                                                       int(detection.Width),
-                                                       int(detection.Height),
-                                                       detection.Confidence,
-                                                       captured_frame.camera.id,
-                                                       int(captured_frame.snapshot_time) +
-                                                       captured_frame.frame_number / 10000,
-                                                       captured_frame.timestamp))
-
-                        # Some logging for debug session
-                        if self.debugging:
-                            if len(balls) == 1 and self.debugging:
-                                ball_sizes.append(balls[0])
-                        else:
-                            if len(balls) > 0:
-                                self.total_detections += 1
-
-                        if len(balls) > 0:
-                            # We declare the examining camera as an active one,
-                            # if there is a ball in the area it covers, but the ball is not in protected area
-                            for ball in balls:
-                                if Linq(self.polygons).any(
-                                        lambda p: p.camera_id == ball.camera_id and
-                                        p.detect and p.contains_ball(ball)) and \
-                                        not Linq(self.polygons).any(
-                                            lambda p: p.camera_id == ball.camera_id and
-                                            (not p.detect) and p.contains_ball(ball)):
-
-                                    if self.active_camera.id != ball.camera_id:
-                                        # Change active camera, but only after 1 second
-                                        if time.time() - last_camera_swapping > 1:
-                                            self.active_camera = self.cameras[ball.camera_id - 1]
-                                            last_camera_swapping = time.time()
-
-                                            # Send message to VideoMaker process
-                                            for detection_queue in self.detection_queues:
-                                                detection_queue.put_nowait(copy.copy(ball))
-
-                                            self.screen_queue.put_nowait(
-                                                [RecordScreenInfoEventItem(RecordScreenInfo.VR_ACTIVE_CAMERA,
-                                                                           RecordScreenInfoOperation.SET,
-                                                                           ball.camera_id),
-                                                 RecordScreenInfoEventItem(RecordScreenInfo.AI_IS_LIVE,
-                                                                           RecordScreenInfoOperation.SET,
-                                                                           "yes")]
-                                            )
-                                            if self.debugging:
-                                                debug_thread = \
-                                                    threading.Thread(target=self.draw_debug_info,
-                                                                     args=(copy.deepcopy(captured_frame), ball))
-                                                debug_thread.start()
-                                    break
-
-                                # Preserve information about last detection, no matter,
-                                # if we changed the camera or not
-                                camera = self.cameras[captured_frame.camera.id - 1]
-                                camera.last_detection = time.time()
-                        captured_frame.release()
-                    else:
+                                                       "Detector - Exit due to no activity.")])
                         break
-                else:
-                    # This ensures, that this process exits, if it has processed at least one frame,
-                    # and hasn't got any other during the next 5 seconds.
-                    if warmed_up:
-                        if time.time() - last_job > 10:
-                            self.screen_queue.put_nowait(
-                                [RecordScreenInfoEventItem(RecordScreenInfo.CURRENT_TASK,
-                                                           RecordScreenInfoOperation.SET,
-                                                           "Detector - Exit due to no activity.")])
-                            break
+
+                for shared_captured_frame, detections in self.sequencer.pop_ready():
+                    self.process_result(shared_captured_frame, detections)
+
+            for shared_captured_frame, detections in self.sequencer.pop_ready(True):
+                self.process_result(shared_captured_frame, detections)
 
             if self.debugging:
-                Detector.log_balls(ball_sizes)
+                Detector.log_balls(self.ball_sizes)
 
             self.screen_queue.put_nowait([RecordScreenInfoEventItem(RecordScreenInfo.CURRENT_TASK,
                                                                     RecordScreenInfoOperation.SET,
@@ -181,6 +125,91 @@ class Detector(object):
                                            SharedFunctions.get_exception_info(ex))]
             )
 
+    def process_result(self, shared_captured_frame: SharedCapturedFrame, detections: np.ndarray):
+        # Worker has left the frame leased, so that it can be drawn for debugging
+        with sch.lease(shared_captured_frame,
+                       self.frame_rings[shared_captured_frame.camera_id - 1],
+                       self.cameras[shared_captured_frame.camera_id - 1]) as captured_frame:
+            self.process_detections(captured_frame, detections)
+
+        # Frames up to this time can't cause any other camera switch, so VideoMaker may write them.
+        # Watermark follows the switches through the same queue, so it never overtakes them.
+        self.detection_queues[-1].put_nowait(shared_captured_frame.timestamp)
+
+    def process_detections(self, captured_frame: CapturedFrame, detections: np.ndarray):
+        self.total_detections += 1
+        detections_per_second = (self.total_detections / (time.time() - self.detection_started))
+        self.screen_queue.put_nowait(
+            [RecordScreenInfoEventItem(RecordScreenInfo.AI_DETECTIONS_PER_SECOND,
+                                       RecordScreenInfoOperation.SET,
+                                       detections_per_second)])
+
+        # Convert detections into balls. Detections are already filtered by the class id.
+        balls = []
+        for detection in detections:
+            balls.append(Detection(int(detection["left"]),
+                                   int(detection["left"] + detection["width"]),
+                                   int(detection["top"]),
+                                   int(detection["top"] + detection["height"]),
+                                   int(detection["width"]),
+                                   int(detection["height"]),
+                                   float(detection["confidence"]),
+                                   captured_frame.camera.id,
+                                   int(captured_frame.snapshot_time) +
+                                   captured_frame.frame_number / 10000,
+                                   captured_frame.timestamp))
+
+        # Only the balls in the detection areas, outside the protected ones, are tracked and can switch the camera.
+        # Ball on the neighbouring court, or a spare ball on the sideline, would otherwise hold the track,
+        # which then hides the real ball.
+        balls = [ball for ball in balls if self.zone_mask.contains_ball(ball)]
+
+        # Tracked ball comes first, while the detections far from the confirmed track are ignored
+        balls = self.tracker.update(captured_frame.camera.id, balls, captured_frame.timestamp)
+
+        # Some logging for debug session
+        if self.debugging:
+            if len(balls) == 1 and self.debugging:
+                self.ball_sizes.append(balls[0])
+        else:
+            if len(balls) > 0:
+                self.total_detections += 1
+
+        if len(balls) > 0:
+            # We declare the examining camera as an active one, if there is a ball in the area it covers
+            ball = balls[0]
+            self.last_detections[ball.camera_id - 1] = time.monotonic()
+
+            if self.active_camera.id != ball.camera_id:
+                # Change active camera, but only after 1 second
+                if time.time() - self.last_camera_swapping > 1:
+                    self.active_camera = self.cameras[ball.camera_id - 1]
+                    self.last_camera_swapping = time.time()
+
+                    # Send message to VideoMaker process. Detection is a plain record,
+                    # so the same object is pickled into every queue.
+                    for detection_queue in self.detection_queues:
+                        detection_queue.put_nowait(ball)
+
+                    self.screen_queue.put_nowait(
+                        [RecordScreenInfoEventItem(RecordScreenInfo.VR_ACTIVE_CAMERA,
+                                                   RecordScreenInfoOperation.SET,
+                                                   ball.camera_id),
+                         RecordScreenInfoEventItem(RecordScreenInfo.AI_IS_LIVE,
+                                                   RecordScreenInfoOperation.SET,
+                                                   "yes")]
+                    )
+                    if self.debugging:
+                        debug_thread = \
+                            threading.Thread(target=self.draw_debug_info,
+                                             args=(captured_frame.detach(), ball))
+                        debug_thread.start()
+
+            # Preserve information about last detection, no matter,
+            # if we changed the camera or not
+            camera = self.cameras[captured_frame.camera.id - 1]
+            camera.last_detection = time.time()
+
     @staticmethod
     def log_balls(ball_sizes: List[Detection]):
         ball_sizes_lines: List[str] = ["height\twidth\tleft\tright\ttop\tbottom\tconfidence\tcamera\tframe_number\r\n"]
@@ -200,17 +229,20 @@ class Detector(object):
         SharedFunctions.create_list_file(r"/home/sportsreplay/tmp/recording/detected-balls.txt", ball_sizes_lines)
 
     def draw_debug_info(self, captured_frame: CapturedFrame, ball: Detection):
+        # AI frames might have been downscaled by the camera process
+        ratio = captured_frame.frame.shape[1] / 480
+
         # Draw protected area first
         for polygon_definition in self.polygons:
             if polygon_definition.camera_id == captured_frame.camera.id:
-                points = SharedFunctions.get_points_array(polygon_definition.points, self.width / 480)
+                points = SharedFunctions.get_points_array(polygon_definition.points, ratio)
                 pts = np.array(points, np.int32)
                 pts = pts.reshape((-1, 1, 2))
                 border_color = (255, 0, 0) if not polygon_definition.detect else (0, 0, 0)
                 cv2.polylines(captured_frame.frame, [pts], True, border_color)
 
         # Draw last detection
-        points = SharedFunctions.get_points_array(ball.points, self.width / 480)
+        points = SharedFunctions.get_points_array(ball.points, ratio)
         pts = np.array(points, np.int32)
         pts = pts.reshape((-1, 1, 2))
         cv2.polylines(captured_frame.frame, [pts], True, (52, 158, 190))
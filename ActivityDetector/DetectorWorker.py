@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+import time
+import queue
+import threading
+import numpy as np
+import multiprocessing as mp
+from typing import List
+from Shared.CapturedFrame import CapturedFrame, SharedCapturedFrame, SharedCapturedFrameHandler as sch
+from Shared.SharedFrameRing import SharedFrameRing
+from Shared.Camera import Camera
+from Shared.SharedFunctions import SharedFunctions
+from Shared.DefinedPolygon import DefinedPolygon
+from ActivityDetector.InferenceBackend import InferenceBackend
+from ActivityDetector.TiledInference import TiledInference
+from ActivityDetector.BallTracker import BallTracker
+from Shared.RecordScreenInfo import RecordScreenInfo
+from Shared.RecordScreenInfoEventItem import RecordScreenInfoEventItem
+from Shared.RecordScreenInfoOperation import RecordScreenInfoOperation
+
+
+class DetectionJob(object):
+    """
+    Frames of one batch from the AI frame queue, on their way through the preparation and inference stages.
+    Their crops might span several network batches, whose results are collected until all of them are done.
+    """
+    def __init__(self, shared_captured_frames: List[SharedCapturedFrame], captured_frames: List[CapturedFrame],
+                 owners: List[int], regions: List[tuple]):
+        self.shared_captured_frames = shared_captured_frames
+        self.captured_frames = captured_frames
+        self.owners = owners
+        self.regions = regions
+        self.results: List[np.ndarray] = []
+
+    def is_complete(self) -> bool:
+        return len(self.results) == len(self.owners)
+
+
+class DetectorWorker(object):
+    """
+    One of the detector processes sharing the AI frame queue. The worker runs the network over the frames,
+    and sends their descriptors with the detections to Detector, which still holds the lease of each frame.
+    The end of the work is signalled with None.
+    Frames are prepared by a thread of their own, into one network input, while the network runs over the other.
+    """
+    # How long the worker blocks on the empty queue, before it checks if it should exit
+    QUEUE_TIMEOUT: float = 0.5
+
+    def __init__(self, worker_id: int, ai_frame_queue: mp.Queue, result_queue: mp.Queue, screen_queue: mp.Queue,
+                 class_id: int, network_config_path: str, network_weights_path: str, coco_config_path: str,
+                 coco_labels_path: str, onnx_model_path: str, engine: str, batch_size: int,
+                 inference_mode: str, tiles: tuple, tile_overlap: float,
+                 cameras: List[Camera], polygons: List[DefinedPolygon], frame_rings: List[SharedFrameRing],
+                 shared_tracks: mp.Array, track_max_age: float, track_roi: bool):
+        self.worker_id = worker_id
+        self.ai_frame_queue = ai_frame_queue
+        self.result_queue = result_queue
+        self.screen_queue = screen_queue
+        self.frame_rings = frame_rings
+
+        self.class_id = class_id
+        self.network_config_path = network_config_path
+        self.network_weights_path = network_weights_path
+        self.coco_config_path = coco_config_path
+        self.coco_labels_path = coco_labels_path
+        self.onnx_model_path = onnx_model_path
+        self.engine = engine
+        self.batch_size = batch_size
+        self.inference_mode = inference_mode
+        self.tiles = tiles
+        self.tile_overlap = tile_overlap
+        self.cameras = cameras
+        self.polygons = polygons
+        # Tracks are kept by Detector, the worker only loads them for the regions of interest
+        self.tracker = BallTracker(track_max_age, track_roi, shared_tracks)
+
+    def start(self):
+        try:
+            # load the object detection network, with the engine chosen in the configuration.
+            # Failure to load it ends the worker the same way as any other, so that Detector doesn't wait for it.
+            net: InferenceBackend = InferenceBackend.create(self.engine,
+                                                            self.network_config_path,
+                                                            self.network_weights_path,
+                                                            self.coco_config_path,
+                                                            self.coco_labels_path,
+                                                            self.onnx_model_path,
+                                                            (self.cameras[0].width, self.cameras[0].height),
+                                                            self.batch_size)
+            # Frames are cropped to the detection areas, and optionally tiled, before they are detected
+            inference = TiledInference(net, self.polygons, self.inference_mode, self.tiles, self.tile_overlap)
+
+            # Inputs are passed between the stages: the free ones to the preparation,
+            # and the prepared ones to the network
+            free_buffers = queue.Queue()
+            for buffer in range(InferenceBackend.BUFFERS):
+                free_buffers.put(buffer)
+            prepared_buffers = queue.Queue()
+
+            preparation = threading.Thread(target=self.prepare,
+                                           args=(net, inference, free_buffers, prepared_buffers),
+                                           daemon=True)
+            preparation.start()
+
+            while True:
+                prepared = prepared_buffers.get()
+                if prepared is None:
+                    break
+
+                job, buffer, images = prepared
+                job.results.extend(net.infer_batch(images, [self.class_id], buffer, True))
+                free_buffers.put(buffer)
+
+                if job.is_complete():
+                    for shared_captured_frame, detections in \
+                            zip(job.shared_captured_frames,
+                                inference.collect([f.frame for f in job.captured_frames],
+                                                  job.owners, job.regions, job.results)):
+                        self.result_queue.put((shared_captured_frame, detections))
+
+            preparation.join()
+            net.close()
+
+        except Exception as ex:
+            self.report_exception(ex)
+        finally:
+            self.result_queue.put(None)
+
+    def prepare(self, net: InferenceBackend, inference: TiledInference, free_buffers: queue.Queue,
+                prepared_buffers: queue.Queue):
+        try:
+            last_job = time.time()
+            finished = False
+            while not finished:
+                try:
+                    shared_captured_frame = self.ai_frame_queue.get(timeout=self.QUEUE_TIMEOUT)
+                    received = True
+                except queue.Empty:
+                    received = False
+
+                if received:
+                    last_job = time.time()
+
+                    # Fill the batch with the frames which are already waiting in the queue
+                    shared_captured_frames: List[SharedCapturedFrame] = []
+                    while shared_captured_frame is not None:
+                        shared_captured_frames.append(shared_captured_frame)
+                        if len(shared_captured_frames) == self.batch_size:
+                            break
+                        try:
+                            shared_captured_frame = self.ai_frame_queue.get_nowait()
+                        except queue.Empty:
+                            break
+
+                    # We are stopping detection if we have reached the end of the queue for all cameras.
+                    # The end is passed on to the other workers.
+                    finished = shared_captured_frame is None
+                    if finished:
+                        try:
+                            self.ai_frame_queue.put_nowait(None)
+                        except queue.Full:
+                            pass
+
+                    if len(shared_captured_frames) > 0:
+                        self.prepare_job(net, inference, shared_captured_frames, free_buffers, prepared_buffers)
+                else:
+                    # Still scenes send no candidates, so the worker waits for the end of the cameras.
+                    # It exits on its own only if the end got lost, 10 seconds after the end of capture.
+                    if SharedFunctions.is_idle(last_job, self.cameras[0].end_of_capture, 10):
+                        break
+
+        except Exception as ex:
+            self.report_exception(ex)
+        finally:
+            prepared_buffers.put(None)
+
+    def prepare_job(self, net: InferenceBackend, inference: TiledInference,
+                    shared_captured_frames: List[SharedCapturedFrame], free_buffers: queue.Queue,
+                    prepared_buffers: queue.Queue):
+        # The frames are read straight from shared memory, while Detector releases them after the results
+        captured_frames = [sch.lease(f, self.frame_rings[f.camera_id - 1], self.cameras[f.camera_id - 1])
+                           for f in shared_captured_frames]
+
+        print("Worker {} detecting frames from cameras {}".format(self.worker_id,
+                                                                  [f.camera.id for f in captured_frames]))
+        # Frames of the cameras with the tracked ball are restricted to its surroundings
+        self.tracker.load()
+        rois = [self.tracker.get_roi(f.camera.id, f.timestamp) for f in captured_frames]
+        crops, owners, regions = inference.plan([f.frame for f in captured_frames],
+                                                [f.camera.id for f in captured_frames],
+                                                rois)
+        job = DetectionJob(shared_captured_frames, captured_frames, owners, regions)
+
+        # Each network batch waits for the free input, while the network runs over the previous one
+        for start in range(0, len(crops), net.batch_size):
+            batch_crops = crops[start:start + net.batch_size]
+            buffer = free_buffers.get()
+            net.prepare_batch(batch_crops, buffer)
+            prepared_buffers.put((job, buffer, len(batch_crops)))
+
+    def report_exception(self, ex: Exception):
+        self.screen_queue.put_nowait(
+            [RecordScreenInfoEventItem(RecordScreenInfo.AI_EXCEPTIONS,
+                                       RecordScreenInfoOperation.ADD,
+                                       1),
+             RecordScreenInfoEventItem(RecordScreenInfo.ERROR_LOG,
+                                       RecordScreenInfoOperation.SET,
+                                       SharedFunctions.get_exception_info(ex))]
+        )
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+import cv2
+import numpy
+from typing import List
+from Shared.YoloDetection import YoloDetection
+from Shared.InferenceEngine import InferenceEngine
+
+
+class InferenceBackend(object):
+    """
+    Common contract of the inference engines. Frames are preprocessed into the float input of the whole batch,
+    and every engine returns the detections as YoloDetection.DTYPE records, scaled to the 480x270 space
+    in which the polygons are defined.
+    There are two inputs, so that the next batch can be prepared, while the network runs over the other one.
+    """
+    BUFFERS: int = 2
+
+    def __init__(self, class_names: List[str], network_width: int, network_height: int, batch_size: int,
+                 input_buffers: List[numpy.ndarray] = None):
+        self.class_names = class_names
+        self.network_width = network_width
+        self.network_height = network_height
+        self.batch_size = batch_size
+        self.scaleX = 480 / self.network_width
+        self.scaleY = 270 / self.network_height
+
+        # Inputs of the whole batch are allocated once, unless the engine provides its own memory.
+        # Staging buffers are reused for resizing and colour conversion.
+        if input_buffers is None:
+            input_buffers = [numpy.empty((self.batch_size, 3, self.network_height, self.network_width),
+                                         dtype=numpy.float32) for _ in range(self.BUFFERS)]
+        self._inputs = input_buffers
+        self._resized = numpy.empty((self.network_height, self.network_width, 3), dtype=numpy.uint8)
+        self._rgb = numpy.empty((self.network_height, self.network_width, 3), dtype=numpy.uint8)
+
+    @staticmethod
+    def create(engine: str, network_config_path: str, network_weights_path: str, coco_config_path: str,
+               coco_labels_path: str, onnx_model_path: str, original_image_size: tuple,
+               batch_size: int) -> "InferenceBackend":
+        # Engines are imported only when used, as each of them loads its own native library
+        if engine == InferenceEngine.DARKNET:
+            from Darknet.DarknetDetector import DarknetDetector
+            return DarknetDetector(network_config_path, network_weights_path, coco_config_path,
+                                   original_image_size, batch_size)
+        if engine == InferenceEngine.OPENCV:
+            from ActivityDetector.OpenCvDnnDetector import OpenCvDnnDetector
+            return OpenCvDnnDetector(network_config_path, network_weights_path, coco_labels_path, batch_size)
+        if engine == InferenceEngine.ONNX:
+            from ActivityDetector.OnnxDetector import OnnxDetector
+            return OnnxDetector(onnx_model_path, network_config_path, coco_labels_path, batch_size)
+        raise ValueError("Unknown inference engine {}.".format(engine))
+
+    def detect(self, img: numpy.array, display_results: bool, class_ids: List[int] = None) -> numpy.ndarray:
+        return self.detect_batch([img], display_results, class_ids)[0]
+
+    def detect_batch(self, images: List[numpy.array], display_results: bool,
+                     class_ids: List[int] = None) -> List[numpy.ndarray]:
+        results: List[numpy.ndarray] = []
+        for start in range(0, len(images), self.batch_size):
+            batch_images = images[start:start + self.batch_size]
+            self.prepare_batch(batch_images, 0)
+            results.extend(self.infer_batch(len(batch_images), class_ids, 0, display_results))
+
+        return results
+
+    def prepare_batch(self, images: List[numpy.array], buffer: int):
+        # Fills the input buffer with up to batch size images
+        for i, img in enumerate(images):
+            self.preprocess(img, i, buffer)
+
+    def infer_batch(self, images: int, class_ids: List[int], buffer: int,
+                    display_results: bool) -> List[numpy.ndarray]:
+        results = self.infer(images, class_ids, buffer)
+        for result in results:
+            self.rescale(result)
+            if display_results:
+                self.display(result)
+        return results
+
+    def infer(self, images: int, class_ids: List[int], buffer: int) -> List[numpy.ndarray]:
+        # Runs the network over the first images of the prepared input, returning the records in network pixels
+        raise NotImplementedError()
+
+    def preprocess(self, img: numpy.array, index: int, buffer: int = 0):
+        # Resize first, so that the colour conversion and normalisation run on the small image
+        cv2.resize(img, (self.network_width, self.network_height), dst=self._resized, interpolation=cv2.INTER_LINEAR)
+        cv2.cvtColor(self._resized, cv2.COLOR_BGR2RGB, dst=self._rgb)
+        numpy.divide(self._rgb.transpose(2, 0, 1), numpy.float32(255), out=self._inputs[buffer][index],
+                     dtype=numpy.float32)
+
+    def close(self):
+        self._inputs = None
+
+    def rescale(self, result: numpy.ndarray):
+        result["left"] *= self.scaleX
+        result["width"] *= self.scaleX
+        result["top"] *= self.scaleY
+        result["height"] *= self.scaleY
+
+    def display(self, result: numpy.ndarray):
+        print("")
+        print("")
+
+        if len(result) == 0:
+            print("No objects detected")
+        else:
+            print("There are {} objects detected:".format(len(result)))
+            for detection in result:
+                print("Detected [Class='{}', Confidence={}%, X={}, Y={}, Width={}, Height={}]".format(
+                    self.class_names[int(detection["class_id"])],
+                    int(detection["confidence"] * 100),
+                    int(detection["left"]),
+                    int(detection["top"]),
+                    int(detection["width"]),
+                    int(detection["height"])
+                ))
+
+    @staticmethod
+    def get_class_names(class_names_file_path: str) -> List[str]:
+        return open(class_names_file_path).read().strip().split("\n")
+
+    @staticmethod
+    def get_network_size(network_config_path: str) -> (int, int):
+        # Width and height of the network input are read from the [net] section of the darknet configuration
+        size = {}
+        with open(network_config_path) as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("[") and line != "[net]":
+                    break
+                if "=" in line:
+                    key, value = [v.strip() for v in line.split("=", 1)]
+                    if key in ("width", "height"):
+                        size[key] = int(value)
+        return size["width"], size["height"]
+
+    @staticmethod
+    def get_detection_records(boxes: numpy.ndarray, scores: numpy.ndarray, class_ids: List[int],
+                              thresh: float = .5, nms: float = .45) -> numpy.ndarray:
+        """
+        Converts the raw YOLO output of one image into the detection records.
+        Boxes are (rows, 4) centres and sizes in network pixels, scores are (rows, classes) confidences.
+        Rows below the threshold are discarded before the non maximum suppression of each requested class.
+        """
+        if class_ids is None:
+            class_ids = range(scores.shape[1])
+        class_ids = numpy.asarray(class_ids, dtype=numpy.intp)
+
+        scores = scores[:, class_ids]
+        rows, columns = numpy.nonzero(scores > thresh)
+        keep = []
+        for column in numpy.unique(columns):
+            candidates = rows[columns == column]
+            rectangles = numpy.column_stack((boxes[candidates, 0] - boxes[candidates, 2] / 2,
+                                             boxes[candidates, 1] - boxes[candidates, 3] / 2,
+                                             boxes[candidates, 2],
+                                             boxes[candidates, 3]))
+            indices = cv2.dnn.NMSBoxes(rectangles.tolist(), scores[candidates, column].tolist(), thresh, nms)
+            for index in numpy.asarray(indices, dtype=numpy.intp).reshape(-1):
+                keep.append((candidates[index], column))
+
+        res = numpy.empty(len(keep), dtype=YoloDetection.DTYPE)
+        if len(keep) > 0:
+            rows, columns = numpy.array(keep, dtype=numpy.intp).T
+            # The most confident detections come first, as with the darknet engine
+            order = numpy.argsort(-scores[rows, columns], kind="stable")
+            rows = rows[order]
+            columns = columns[order]
+
+            # Box position is the centre of the box, which is what the darknet engine reports as well
+            res["class_id"] = class_ids[columns]
+            res["confidence"] = scores[rows, columns]
+            res["left"] = boxes[rows, 0]
+            res["top"] = boxes[rows, 1]
+            res["width"] = boxes[rows, 2]
+            res["height"] = boxes[rows, 3]
+        return res
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+import cv2
+import numpy as np
+from typing import Dict
+from Shared.ZoneMask import ZoneMask
+
+
+class MotionGate(object):
+    """
+    Cheap filter in front of the network. Each camera keeps a small greyscale background model,
+    and the frame is detected only if enough pixels inside the camera's detection areas differ from it.
+    """
+    def __init__(self, zone_mask: ZoneMask, threshold: float, pixel_threshold: int, background_alpha: float,
+                 size: (int, int) = (160, 90)):
+        self.zone_mask = zone_mask
+        # Part of the detection area which has to move, zero disables the gate
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.background_alpha = background_alpha
+        self.size = size
+
+        self.backgrounds: Dict[int, np.ndarray] = {}
+        self.masks: Dict[int, np.ndarray] = {}
+
+        # Buffers are reused for every frame
+        self._small = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        self._grey = np.empty((size[1], size[0]), dtype=np.uint8)
+        self._grey_float = np.empty((size[1], size[0]), dtype=np.float32)
+        self._difference = np.empty((size[1], size[0]), dtype=np.float32)
+
+    def is_moving(self, camera_id: int, frame: np.ndarray) -> bool:
+        if self.threshold <= 0:
+            return True
+
+        cv2.resize(frame, self.size, dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._grey)
+
+        background = self.backgrounds.get(camera_id)
+        if background is None:
+            # Nothing to compare the first frame with
+            self.backgrounds[camera_id] = self._grey.astype(np.float32)
+            self.masks[camera_id] = self.zone_mask.get_detect_mask(camera_id, self.size)
+            return True
+
+        # Motion energy is the part of the detection area, which differs from the background
+        self._grey_float[...] = self._grey
+        cv2.absdiff(self._grey_float, background, dst=self._difference)
+        cv2.threshold(self._difference, self.pixel_threshold, 1, cv2.THRESH_BINARY, dst=self._difference)
+        energy = cv2.mean(self._difference, mask=self.masks[camera_id])[0]
+
+        cv2.accumulateWeighted(self._grey_float, background, self.background_alpha)
+        return energy >= self.threshold
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+import numpy
+import onnxruntime
+from typing import List
+from ActivityDetector.InferenceBackend import InferenceBackend
+
+
+class OnnxDetector(InferenceBackend):
+    def __init__(self, model_path: str, cfg_path: str, class_names_path: str, batch_size: int = 1):
+        self._session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        self._input_name = self._session.get_inputs()[0].name
+
+        # Models exported with the dynamic input size don't know it, so it is read from the darknet configuration
+        shape = self._session.get_inputs()[0].shape
+        if isinstance(shape[2], int) and isinstance(shape[3], int):
+            network_width, network_height = shape[3], shape[2]
+        else:
+            network_width, network_height = InferenceBackend.get_network_size(cfg_path)
+        super().__init__(InferenceBackend.get_class_names(class_names_path), network_width, network_height,
+                         batch_size)
+
+        # Models exported with the fixed batch expect the whole batch
+        self._fixed_batch = isinstance(shape[0], int)
+
+    def infer(self, images: int, class_ids: List[int], buffer: int) -> List[numpy.ndarray]:
+        if self._fixed_batch:
+            self._inputs[buffer][images:] = 0
+            batch = self._inputs[buffer]
+        else:
+            batch = self._inputs[buffer][:images]
+
+        # The first output holds the rows of each image: centre and size in network pixels,
+        # objectness and the class probabilities
+        output = self._session.run(None, {self._input_name: batch})[0]
+        return [InferenceBackend.get_detection_records(rows[:, :4], rows[:, 5:] * rows[:, 4:5], class_ids)
+                for rows in output[:images]]
+
+    def close(self):
+        super().close()
+        self._session = None
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+import cv2
+import numpy
+from typing import List
+from ActivityDetector.InferenceBackend import InferenceBackend
+
+
+class OpenCvDnnDetector(InferenceBackend):
+    def __init__(self, cfg_path: str, weights_path: str, class_names_path: str, batch_size: int = 1):
+        network_width, network_height = InferenceBackend.get_network_size(cfg_path)
+        super().__init__(InferenceBackend.get_class_names(class_names_path), network_width, network_height,
+                         batch_size)
+
+        # The same darknet network, run by the OpenCV DNN module on the CPU
+        self._net = cv2.dnn.readNetFromDarknet(cfg_path, weights_path)
+        self._net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self._net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self._output_layers = self._net.getUnconnectedOutLayersNames()
+
+    def infer(self, images: int, class_ids: List[int], buffer: int) -> List[numpy.ndarray]:
+        self._net.setInput(self._inputs[buffer][:images])
+        outputs = self._net.forward(self._output_layers)
+
+        # Rows of each YOLO layer are ordered by image: centre, size, objectness and the class confidences,
+        # relative to the input size. Class confidences already include the objectness.
+        outputs = numpy.concatenate([o.reshape(images, -1, o.shape[-1]) for o in outputs], axis=1)
+        size = numpy.array([self.network_width, self.network_height, self.network_width, self.network_height],
+                           dtype=numpy.float32)
+        return [InferenceBackend.get_detection_records(output[:, :4] * size, output[:, 5:], class_ids)
+                for output in outputs]
+
+    def close(self):
+        super().close()
+        self._net = None
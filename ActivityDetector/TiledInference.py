@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+import cv2
+import numpy as np
+from typing import List, Dict
+from ActivityDetector.InferenceBackend import InferenceBackend
+from Shared.DefinedPolygon import DefinedPolygon
+from Shared.InferenceMode import InferenceMode
+from Shared.YoloDetection import YoloDetection
+
+
+class TiledInference(object):
+    """
+    Runs the network over the parts of the frames which matter. Each frame is cropped to the bounding box
+    of its camera's detection areas, which is optionally split into overlapping tiles.
+    All crops are detected in one batch, and the detections are merged back into the 480x270 frame space.
+    """
+    def __init__(self, net: InferenceBackend, polygons: List[DefinedPolygon], mode: str, tiles: (int, int),
+                 tile_overlap: float, nms: float = .45):
+        self.net = net
+        self.mode = mode
+        self.columns, self.rows = tiles
+        self.tile_overlap = tile_overlap
+        self.nms = nms
+
+        # Bounding boxes (left, top, right, bottom) of the detection areas, in the 480x270 space
+        self.zones: Dict[int, tuple] = {}
+        for camera_id in set(p.camera_id for p in polygons):
+            points = np.array([[p.x, p.y] for polygon in polygons
+                               if polygon.camera_id == camera_id and polygon.detect
+                               for p in polygon.points], dtype=np.float32)
+            if len(points) > 0:
+                x, y, w, h = cv2.boundingRect(points)
+                self.zones[camera_id] = (max(x, 0), max(y, 0), min(x + w, 480), min(y + h, 270))
+
+        # Crop rectangles in frame pixels, per camera and frame size
+        self.regions: Dict[tuple, List[tuple]] = {}
+
+    def detect_batch(self, images: List[np.ndarray], camera_ids: List[int], display_results: bool,
+                     class_ids: List[int] = None, rois: List[tuple] = None) -> List[np.ndarray]:
+        crops, owners, regions = self.plan(images, camera_ids, rois)
+        return self.collect(images, owners, regions, self.net.detect_batch(crops, display_results, class_ids))
+
+    def plan(self, images: List[np.ndarray], camera_ids: List[int],
+             rois: List[tuple] = None) -> (List[np.ndarray], List[int], List[tuple]):
+        """
+        Returns the crops to be detected, with the index of the image and the region (in frame pixels)
+        of each of them. Region of interest (in the 480x270 space) replaces the regions of the image,
+        where it is known.
+        """
+        if rois is None:
+            rois = [None] * len(images)
+
+        crops: List[np.ndarray] = []
+        owners: List[int] = []
+        regions: List[tuple] = []
+        for i, (image, camera_id, roi) in enumerate(zip(images, camera_ids, rois)):
+            if roi is not None:
+                image_regions = [self.to_pixels(roi, image.shape)]
+            elif self.mode == InferenceMode.FULL:
+                image_regions = [(0, 0, image.shape[1], image.shape[0])]
+            else:
+                image_regions = self.get_regions(camera_id, image.shape)
+            for region in image_regions:
+                left, top, right, bottom = region
+                crops.append(image[top:bottom, left:right])
+                owners.append(i)
+                regions.append(region)
+        return crops, owners, regions
+
+    def collect(self, images: List[np.ndarray], owners: List[int], regions: List[tuple],
+                results: List[np.ndarray]) -> List[np.ndarray]:
+        # Detections of the crops are merged back into the detections of each image
+        detections: List[List[np.ndarray]] = [[] for _ in images]
+        for owner, region, result in zip(owners, regions, results):
+            detections[owner].append(self.to_frame_space(result, region, images[owner].shape))
+
+        return [self.merge(d) for d in detections]
+
+    def get_regions(self, camera_id: int, shape: tuple) -> List[tuple]:
+        key = (camera_id, shape[:2])
+        if key not in self.regions:
+            left, top, right, bottom = self.to_pixels(self.zones.get(camera_id, (0, 0, 480, 270)), shape)
+
+            regions = [(left, top, right, bottom)]
+            if self.mode == InferenceMode.TILES:
+                regions = []
+                tile_width = (right - left) / (self.columns - (self.columns - 1) * self.tile_overlap)
+                tile_height = (bottom - top) / (self.rows - (self.rows - 1) * self.tile_overlap)
+                for row in range(self.rows):
+                    for column in range(self.columns):
+                        tile_left = left + int(column * tile_width * (1 - self.tile_overlap))
+                        tile_top = top + int(row * tile_height * (1 - self.tile_overlap))
+                        regions.append((tile_left,
+                                        tile_top,
+                                        min(int(np.ceil(tile_left + tile_width)), right),
+                                        min(int(np.ceil(tile_top + tile_height)), bottom)))
+            self.regions[key] = regions
+        return self.regions[key]
+
+    @staticmethod
+    def to_pixels(rectangle: tuple, shape: tuple) -> tuple:
+        # Rectangle in the 480x270 space, converted to the pixels of the frame
+        height, width = shape[:2]
+        left, top, right, bottom = rectangle
+        return (int(left * width / 480),
+                int(top * height / 270),
+                int(np.ceil(right * width / 480)),
+                int(np.ceil(bottom * height / 270)))
+
+    @staticmethod
+    def to_frame_space(result: np.ndarray, region: tuple, shape: tuple) -> np.ndarray:
+        # Detections are scaled by the network to the 480x270 space of the crop
+        height, width = shape[:2]
+        left, top, right, bottom = region
+        scale_x = (right - left) / width
+        scale_y = (bottom - top) / height
+        result["left"] = result["left"] * scale_x + left * 480 / width
+        result["top"] = result["top"] * scale_y + top * 270 / height
+        result["width"] *= scale_x
+        result["height"] *= scale_y
+        return result
+
+    def merge(self, results: List[np.ndarray]) -> np.ndarray:
+        if len(results) == 0:
+            return np.empty(0, dtype=YoloDetection.DTYPE)
+        if len(results) == 1:
+            return results[0]
+
+        # Balls in the overlap of the tiles are detected twice, so the duplicates are suppressed
+        result = np.concatenate(results)
+        keep: List[int] = []
+        for class_id in np.unique(result["class_id"]):
+            candidates = np.nonzero(result["class_id"] == class_id)[0]
+            rectangles = np.column_stack((result["left"][candidates] - result["width"][candidates] / 2,
+                                          result["top"][candidates] - result["height"][candidates] / 2,
+                                          result["width"][candidates],
+                                          result["height"][candidates]))
+            indices = cv2.dnn.NMSBoxes(rectangles.tolist(), result["confidence"][candidates].tolist(), 0, self.nms)
+            keep.extend(candidates[np.asarray(indices, dtype=np.intp).reshape(-1)])
+
+        result = result[np.array(keep, dtype=np.intp)]
+        return result[np.argsort(-result["confidence"], kind="stable")]
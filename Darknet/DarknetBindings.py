@@ -2,6 +2,7 @@
 from ctypes import *
 import os
 import random
+import numpy
 from Shared.YoloDetection import YoloDetection
 from typing import List
 
@@ -40,6 +41,17 @@ class DETECTION(Structure):
                 ("uc", POINTER(c_float))]
 
 
+# Layout of the DETECTION structure, so that the whole array of detections is read by numpy at once
+DETECTION_DTYPE = numpy.dtype({"names": ["x", "y", "w", "h", "prob"],
+                               "formats": [numpy.float32, numpy.float32, numpy.float32, numpy.float32, numpy.uintp],
+                               "offsets": [DETECTION.bbox.offset + BOX.x.offset,
+                                           DETECTION.bbox.offset + BOX.y.offset,
+                                           DETECTION.bbox.offset + BOX.w.offset,
+                                           DETECTION.bbox.offset + BOX.h.offset,
+                                           DETECTION.prob.offset],
+                               "itemsize": sizeof(DETECTION)})
+
+
 class IMAGE(Structure):
     _fields_ = [("w", c_int),
                 ("h", c_int),
@@ -47,6 +59,11 @@ class IMAGE(Structure):
                 ("data", POINTER(c_float))]
 
 
+class DETNUMPAIR(Structure):
+    _fields_ = [("num", c_int),
+                ("dets", POINTER(DETECTION))]
+
+
 class METADATA(Structure):
     _fields_ = [("classes", c_int),
                 ("names", POINTER(c_char_p))]
@@ -132,6 +149,13 @@ predict_image_letterbox = lib.network_predict_image_letterbox
 predict_image_letterbox.argtypes = [c_void_p, IMAGE]
 predict_image_letterbox.restype = POINTER(c_float)
 
+predict_batch = lib.network_predict_batch
+predict_batch.argtypes = [c_void_p, IMAGE, c_int, c_int, c_int, c_float, c_float, POINTER(c_int), c_int, c_int]
+predict_batch.restype = POINTER(DETNUMPAIR)
+
+free_batch_detections = lib.free_batch_detections
+free_batch_detections.argtypes = [POINTER(DETNUMPAIR), c_int]
+
 
 def classify(net, meta, im):
     out = predict_image(net, im)
@@ -152,6 +176,77 @@ def detect_image(net, meta, image, thresh=.5, hier_thresh=.5, nms=.45, debug=Fal
     if nms:
         do_nms_sort(dets, num, meta.classes, nms)
 
+    res = get_detections(meta, dets, num)
+    free_detections(dets, num)
+    return res
+
+
+def detect_image_records(net, meta, image, class_ids, thresh=.5, hier_thresh=.5, nms=.45) -> numpy.ndarray:
+    num = c_int(0)
+    pnum = pointer(num)
+    letter_box = 0
+    predict_image(net, image)
+    dets = get_network_boxes(net, image.w, image.h, thresh, hier_thresh, None, 0, pnum, letter_box)
+    num = pnum[0]
+    if nms:
+        do_nms_sort(dets, num, meta.classes, nms)
+
+    res = get_detection_records(meta, dets, num, class_ids)
+    free_detections(dets, num)
+    return res
+
+
+def detect_batch_image(net, meta, image, batch_size, images, class_ids, thresh=.5, hier_thresh=.5,
+                       nms=.45) -> List[numpy.ndarray]:
+    # The image holds the whole batch, while only the first images are real frames
+    letter_box = 0
+    batch_dets = predict_batch(net, image, batch_size, image.w, image.h, thresh, hier_thresh, None, 0, letter_box)
+    batch_res = []
+    for b in range(images):
+        num = batch_dets[b].num
+        dets = batch_dets[b].dets
+        if nms:
+            do_nms_obj(dets, num, meta.classes, nms)
+        batch_res.append(get_detection_records(meta, dets, num, class_ids))
+
+    free_batch_detections(batch_dets, batch_size)
+    return batch_res
+
+
+def get_detection_records(meta, dets, num, class_ids, thresh=0) -> numpy.ndarray:
+    # Reads the detections of the requested classes (all classes, if not specified) into the structured array
+    if class_ids is None:
+        class_ids = range(meta.classes)
+    class_ids = numpy.asarray(class_ids, dtype=numpy.intp)
+    if num == 0 or len(class_ids) == 0:
+        return numpy.empty(0, dtype=YoloDetection.DTYPE)
+
+    boxes = numpy.frombuffer((c_char * (num * sizeof(DETECTION))).from_address(addressof(dets.contents)),
+                             dtype=DETECTION_DTYPE)
+
+    # Each detection has its own array of class probabilities, from which only the requested classes are taken
+    probs = numpy.empty((num, len(class_ids)), dtype=numpy.float32)
+    for j in range(num):
+        probs[j] = numpy.frombuffer((c_float * meta.classes).from_address(int(boxes["prob"][j])),
+                                    dtype=numpy.float32)[class_ids]
+
+    rows, columns = numpy.nonzero(probs > thresh)
+    # The most confident detections come first, as with the list of detections
+    order = numpy.argsort(-probs[rows, columns], kind="stable")
+    rows = rows[order]
+    columns = columns[order]
+
+    res = numpy.empty(len(rows), dtype=YoloDetection.DTYPE)
+    res["class_id"] = class_ids[columns]
+    res["confidence"] = probs[rows, columns]
+    res["left"] = boxes["x"][rows]
+    res["top"] = boxes["y"][rows]
+    res["width"] = boxes["w"][rows]
+    res["height"] = boxes["h"][rows]
+    return res
+
+
+def get_detections(meta, dets, num) -> List[YoloDetection]:
     res = []
     for j in range(num):
         for i in range(meta.classes):
@@ -165,6 +260,4 @@ def detect_image(net, meta, image, thresh=.5, hier_thresh=.5, nms=.45, debug=Fal
                                          b.w,
                                          b.h))
 
-    res = sorted(res, key=lambda x: x.ClassID)
-    free_detections(dets, num)
-    return res
+    return sorted(res, key=lambda x: x.ClassID)
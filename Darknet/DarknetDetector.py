@@ -1,59 +1,47 @@
 #!/usr/bin/env python3
 import numpy
 from Darknet.DarknetBindings import *
-from Shared.YoloDetection import YoloDetection
+from ActivityDetector.InferenceBackend import InferenceBackend
 from typing import List
-import cv2
 
 
-class DarknetDetector(object):
-    def __init__(self, cfg_path: str, weights_path: str, classnames_path: str, original_image_size: tuple):
+class DarknetDetector(InferenceBackend):
+    def __init__(self, cfg_path: str, weights_path: str, classnames_path: str, original_image_size: tuple,
+                 batch_size: int = 1):
+        # The network is loaded with the batch size, so that one forward pass handles the frames of all cameras
         self._net = load_net_custom(c_char_p(cfg_path.encode("ascii")),
                                     c_char_p(weights_path.encode("ascii")),
-                                    0, 1)
+                                    0, batch_size)
         #self._net = load_net(c_char_p(cfg_path.encode("ascii")),
         #                     c_char_p(weights_path.encode("ascii")),
         #                     0)
         self._meta = load_meta(c_char_p(classnames_path.encode("ascii")))
-        self.network_width = lib.network_width(self._net)
-        self.network_height = lib.network_height(self._net)
-        self.scaleX = 480 / self.network_width
-        self.scaleY = 270 / self.network_height
-
-    def detect(self, img: numpy.array, display_results: bool) -> List[YoloDetection]:
-        frame_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        frame_resized = cv2.resize(frame_rgb, (self.network_width, self.network_height), interpolation=cv2.INTER_LINEAR)
-        darknet_image = make_image(self.network_width, self.network_height, 3)
-        copy_image_from_bytes(darknet_image, frame_resized.tobytes())
-        result = detect_image(self._net, self._meta, darknet_image)
-        free_image(darknet_image)
-
-        # Rescale the results
-        for detection in result:
-            detection.Left *= self.scaleX
-            detection.Right *= self.scaleX
-            detection.Width *= self.scaleX
-            detection.Top *= self.scaleY
-            detection.Bottom *= self.scaleY
-            detection.Height *= self.scaleY
-
-        if display_results:
-            print("")
-            print("")
-
-            if len(result) == 0:
-                print("No objects detected")
-            else:
-                print("There are {} objects detected:".format(len(result)))
-                for detection in result:
-                    print("Detected [Class='{}', Confidence={}%, X={}, Y={}, Width={}, Height={}]".format(
-                        str(detection.ClassName),
-                        int(detection.Confidence * 100),
-                        int(detection.Left),
-                        int(detection.Top),
-                        int(detection.Width),
-                        int(detection.Height)
-                    ))
-
-        return result
-
+        network_width = lib.network_width(self._net)
+        network_height = lib.network_height(self._net)
+
+        # Input images of the whole batch are allocated once, and the frames are preprocessed straight into
+        # their float buffers, through the numpy views
+        self._images = [make_image(network_width, network_height, 3 * batch_size)
+                        for _ in range(InferenceBackend.BUFFERS)]
+        self._batch_images = [IMAGE(network_width, network_height, 3, image.data) for image in self._images]
+        super().__init__([self._meta.names[i].decode("ascii") for i in range(self._meta.classes)],
+                         network_width, network_height, batch_size,
+                         [numpy.ctypeslib.as_array(image.data, shape=(batch_size, 3, network_height, network_width))
+                          for image in self._images])
+
+    def infer(self, images: int, class_ids: List[int], buffer: int) -> List[numpy.ndarray]:
+        # Network loaded with the batch, always expects the whole batch
+        if self.batch_size == 1:
+            return [detect_image_records(self._net, self._meta, self._batch_images[buffer], class_ids)]
+
+        # Unused part of the batch stays blank
+        self._inputs[buffer][images:] = 0
+        return detect_batch_image(self._net, self._meta, self._batch_images[buffer], self.batch_size, images,
+                                  class_ids)
+
+    def close(self):
+        if self._images is not None:
+            super().close()
+            for image in self._images:
+                free_image(image)
+            self._images = None
@@ -1,17 +1,29 @@
 #!/usr/bin/env python3
 import time
+import math
 import os
 import shutil
 import argparse
 import threading
+import queue
 import multiprocessing as mp
+from multiprocessing import connection
 from typing import List
 from Shared.Configuration import Configuration
 from Shared.SharedFunctions import SharedFunctions
 from Recorder.VideoRecorder import VideoRecorder
+from Recorder.AdaptiveSampler import AdaptiveSampler
+from ActivityDetector.MotionGate import MotionGate
+from Shared.ZoneMask import ZoneMask
 from ActivityDetector.Detector import Detector
+from ActivityDetector.DetectorWorker import DetectorWorker
+from ActivityDetector.BallTracker import BallTracker
 from Shared.Camera import Camera
 from Shared.CapturedFrame import SharedCapturedFrameHandler as sch, SharedCapturedFrame
+from Shared.SharedFrameRing import SharedFrameRing
+from Shared.FrameDropPolicy import FrameDropPolicy
+from Shared.InferenceEngine import InferenceEngine
+from Shared.InferenceMode import InferenceMode
 from VideoMaker.VideoMaker import VideoMaker
 from Shared.DefinedPolygon import DefinedPolygon
 from Uploaders.FtpUploader import FtpUploader
@@ -37,30 +49,51 @@ class Record(object):
 
     @staticmethod
     def start_single_camera(camera: Camera, ai_frame_queue: mp.Queue, video_frame_queue: mp.Queue,
-                            screen_queue: mp.Queue, detection_queue: mp.Queue, debugging: bool):
+                            screen_queue: mp.Queue, detection_queue: mp.Queue, frame_rings: List[SharedFrameRing],
+                            ai_frame_rings: List[SharedFrameRing], ai_drop_policy: str, video_drop_policy: str,
+                            video_latency: float, sampler: AdaptiveSampler, motion_gate: MotionGate,
+                            debugging: bool):
 
         video = VideoRecorder(camera, ai_frame_queue, video_frame_queue, screen_queue,
-                              detection_queue, debugging)
+                              detection_queue, frame_rings, ai_frame_rings, ai_drop_policy, video_drop_policy,
+                              video_latency, sampler, motion_gate, debugging)
         video.start()
 
     @staticmethod
-    def start_activity_detection(playground: int, ai_frame_queue: mp.Queue, detection_queues: List[mp.Queue],
-                                 screen_queue: mp.Queue, class_id: int, network_config: str, network_weights: str,
-                                 coco_config: str, width: int, height: int,
+    def start_activity_detection(playground: int, result_queue: mp.Queue, detection_queues: List[mp.Queue],
+                                 screen_queue: mp.Queue, width: int, height: int,
                                  cameras: List[Camera], polygons: List[DefinedPolygon], number_of_cameras: int,
-                                 debugging: bool):
+                                 frame_rings: List[SharedFrameRing], workers: int, batch_size: int,
+                                 last_detections: mp.Array, shared_tracks: mp.Array, track_max_age: float,
+                                 track_roi: bool, debugging: bool):
 
-        detector = Detector(playground, ai_frame_queue, detection_queues, screen_queue, class_id,
-                            network_config, network_weights, coco_config, width, height, cameras, polygons,
-                            number_of_cameras, debugging)
+        detector = Detector(playground, result_queue, detection_queues, screen_queue, width, height, cameras,
+                            polygons, number_of_cameras, frame_rings, workers, batch_size, last_detections,
+                            shared_tracks, track_max_age, track_roi, debugging)
         detector.start()
 
+    @staticmethod
+    def start_detector_worker(worker_id: int, ai_frame_queue: mp.Queue, result_queue: mp.Queue,
+                              screen_queue: mp.Queue, class_id: int, network_config: str, network_weights: str,
+                              coco_config: str, coco_labels: str, onnx_model: str, engine: str, batch_size: int,
+                              inference_mode: str, tiles: tuple, tile_overlap: float, cameras: List[Camera],
+                              polygons: List[DefinedPolygon], frame_rings: List[SharedFrameRing],
+                              shared_tracks: mp.Array, track_max_age: float, track_roi: bool):
+
+        worker = DetectorWorker(worker_id, ai_frame_queue, result_queue, screen_queue, class_id, network_config,
+                                network_weights, coco_config, coco_labels, onnx_model, engine, batch_size,
+                                inference_mode, tiles, tile_overlap, cameras, polygons, frame_rings, shared_tracks,
+                                track_max_age, track_roi)
+        worker.start()
+
     @staticmethod
     def start_video_making(playground: int, video_frame_queue: mp.Queue, screen_queue: mp.Queue,
-                           detection_queue: mp.Queue, output_video: str, video_latency: float,
-                           polygons: List[DefinedPolygon], width: int, height: int, fps: int, debugging: bool):
+                           detection_queue: mp.Queue, output_video: str, streaming_path: str, video_latency: float,
+                           polygons: List[DefinedPolygon], width: int, height: int, fps: int,
+                           cameras: List[Camera], frame_rings: List[SharedFrameRing], debugging: bool):
         video_maker = VideoMaker(playground, video_frame_queue, screen_queue, detection_queue, output_video,
-                                 video_latency, polygons, width, height, fps, debugging)
+                                 streaming_path, video_latency, polygons, width, height, fps, cameras, frame_rings,
+                                 debugging)
         video_maker.start()
 
     def start(self, debugging: bool):
@@ -99,15 +132,42 @@ class Record(object):
         playground = int(self.config.common["playground"])
         fps = int(self.config.recorder["fps"])
         cdfps = float(self.config.activity_detector["cdfps"])
+        max_cdfps = float(self.config.activity_detector["max-cdfps"])
+        detector_budget = float(self.config.activity_detector["detector-budget"])
+        activity_window = float(self.config.activity_detector["activity-window"])
         width = int(self.config.recorder["width"])
         height = int(self.config.recorder["height"])
         rtsp_user = self.config.recorder["rtsp-user"]
         rtsp_password = self.config.recorder["rtsp-password"]
+        frame_ring_slots = self.config.recorder["frame-ring-slots"].strip()
+        writer_buffer = int(self.config.video_maker["writer-buffer"])
+        ai_frame_ring_slots = int(self.config.activity_detector["ai-frame-ring-slots"])
+        batch_size = int(self.config.activity_detector["batch-size"])
+        detector_workers = int(self.config.activity_detector["workers"])
+        ai_frame_size = SharedFunctions.get_frame_size(self.config.activity_detector["ai-frame-size"])
+        ai_drop_policy = FrameDropPolicy.from_config(self.config.recorder["ai-queue-drop-policy"])
+        video_drop_policy = FrameDropPolicy.from_config(self.config.recorder["video-queue-drop-policy"])
         network_config = os.path.join(os.getcwd(), self.config.activity_detector["network-config"])
         network_weights = os.path.join(os.getcwd(), self.config.activity_detector["network-weights"])
         coco_config = os.path.join(os.getcwd(), self.config.activity_detector["coco-config"])
         coco_labels = os.path.join(os.getcwd(), self.config.activity_detector["coco-labels"])
         class_id = SharedFunctions.get_class_id(coco_labels, self.config.activity_detector["sports-ball"])
+        engine = InferenceEngine.from_config(self.config.activity_detector["engine"])
+        onnx_model = os.path.join(os.getcwd(), self.config.activity_detector["onnx-model"])
+        inference_mode = InferenceMode.from_config(self.config.activity_detector["inference-mode"])
+        tiles = tuple(int(t) for t in self.config.activity_detector["tiles"].split(","))
+        tile_overlap = float(self.config.activity_detector["tile-overlap"])
+        # Crops and tiles are cut from the AI frame, so they would only upsample the frame already downscaled
+        # to the space of the polygons, without any detail gained for the small balls
+        if inference_mode != InferenceMode.FULL and ai_frame_size is not None and \
+                (ai_frame_size[0] <= 480 or ai_frame_size[1] <= 270):
+            raise ValueError("Inference mode {} needs ai-frame-size empty, or larger than 480,270."
+                             .format(inference_mode))
+        motion_threshold = float(self.config.activity_detector["motion-threshold"])
+        motion_pixel_threshold = int(self.config.activity_detector["motion-pixel-threshold"])
+        motion_background_alpha = float(self.config.activity_detector["motion-background-alpha"])
+        track_max_age = float(self.config.activity_detector["track-max-age"])
+        track_roi = self.config.activity_detector["track-roi"].strip().lower() == "true"
         polygons_path = os.path.normpath(r"{}".format(self.config.activity_detector["polygons"]))
         polygons_json = SharedFunctions.read_text_file(polygons_path)
         pi_host = self.config.tv_box["host"]
@@ -116,6 +176,8 @@ class Record(object):
 
         # Initialise the polygons (for covered, and restricted areas).
         polygons: List[DefinedPolygon] = DefinedPolygon.get_polygons(polygons_json)
+        # Each camera process keeps the motion model of its own camera, which sees all of its candidates
+        zone_mask = ZoneMask(polygons)
 
         # Ensure session directory exists
         session_path = SharedFunctions.get_recording_path(recording_path,
@@ -127,13 +189,39 @@ class Record(object):
         output_video = SharedFunctions.get_output_video(video_making_path, playground, self.planned_start_time)
 
         # Define the queues, for the communication between the threads
-        ai_frame_queue = mp.Queue(20)
-        video_frame_queue = mp.Queue(200)
+        ai_frame_queue_size = 20
+        ai_frame_queue = mp.Queue(ai_frame_queue_size)
         screen_queues = []
         detection_queues = []
 
+        # Unless configured, the ring of each camera is sized for the frames held back for the save delay
+        # and by the reorder buffer, one more second of frames on their way, the frames waiting for the encoder,
+        # and the queued AI frames, if they share the slots of the video frames
+        if frame_ring_slots == "":
+            frame_ring_slots = math.ceil(fps * (video_latency + VideoMaker.REORDER_MARGIN + 1)) + writer_buffer
+            if ai_frame_size is None:
+                frame_ring_slots += ai_frame_queue_size
+        else:
+            frame_ring_slots = int(frame_ring_slots)
+
+        # Frames in the video queue come from the active camera's ring, next to the frames held back,
+        # reordered, encoded and detected. The queue is bounded by what is left of the ring, so that it fills up
+        # before the ring runs out, and the configured drop policy decides which frame is dropped.
+        video_frame_queue_size = frame_ring_slots - math.ceil(fps * (video_latency + VideoMaker.REORDER_MARGIN)) \
+            - writer_buffer
+        if ai_frame_size is None:
+            video_frame_queue_size -= ai_frame_queue_size
+        video_frame_queue = mp.Queue(max(video_frame_queue_size, 1))
+
+        # Preallocated shared memory slots, for the frames of each camera
+        frame_rings: List[SharedFrameRing] = []
+        ai_frame_rings: List[SharedFrameRing] = []
+
         cameras = []
 
+        # Detector shares the time of the last detection of each camera, so that the cameras adapt their sampling
+        last_detections = mp.Array("d", len(video_addresses))
+
         # For each camera defined in the settings, generate one thread
         for v in video_addresses:
             i += 1
@@ -188,6 +276,19 @@ class Record(object):
                             playground, session_path, self.planned_start_time, start_of_capture, end_of_capture)
             cameras.append(camera)
 
+            # Create the frame ring of the camera, before any of the processes attach to it
+            frame_ring = SharedFrameRing("frames", i, frame_ring_slots, (height, width, 3))
+            frame_ring.create()
+            frame_rings.append(frame_ring)
+
+            # AI frames are either downscaled into a ring of their own, or they share the frame ring
+            if ai_frame_size is not None:
+                ai_frame_ring = SharedFrameRing("ai", i, ai_frame_ring_slots, (ai_frame_size[1], ai_frame_size[0], 3))
+                ai_frame_ring.create()
+            else:
+                ai_frame_ring = frame_ring
+            ai_frame_rings.append(ai_frame_ring)
+
             # Add queue which will send detections from Detector to respective camera
             detection_queue = mp.Queue(10)
             detection_queues.append(detection_queue)
@@ -199,7 +300,13 @@ class Record(object):
             # Create recording thread
             processes.append(mp.Process(target=self.start_single_camera,
                                         args=(camera, ai_frame_queue, video_frame_queue, screen_queue,
-                                              detection_queue, debugging)))
+                                              detection_queue, frame_rings, ai_frame_rings, ai_drop_policy,
+                                              video_drop_policy, video_latency,
+                                              AdaptiveSampler(i, last_detections, detector_budget, cdfps, max_cdfps,
+                                                              activity_window),
+                                              MotionGate(zone_mask, motion_threshold, motion_pixel_threshold,
+                                                         motion_background_alpha),
+                                              debugging)))
 
         # Add one more queue which will send detections from Detector to VideoMaker
         detection_queues.append(mp.Queue())
@@ -207,11 +314,23 @@ class Record(object):
         detection_screen_queue = mp.Queue(2000)
         screen_queues.append(detection_screen_queue)
 
-        # Create activity detection thread
+        # Create the detector workers, which share the AI frame queue, and the detector, which orders their results
+        # and switches the cameras
+        result_queue = mp.Queue()
+        shared_tracks = BallTracker.create_shared_tracks(len(video_addresses))
+        for worker_id in range(1, detector_workers + 1):
+            processes.append(mp.Process(target=self.start_detector_worker,
+                                        args=(worker_id, ai_frame_queue, result_queue, detection_screen_queue,
+                                              class_id, network_config, network_weights, coco_config, coco_labels,
+                                              onnx_model, engine, batch_size, inference_mode, tiles, tile_overlap,
+                                              cameras, polygons, ai_frame_rings, shared_tracks, track_max_age,
+                                              track_roi)))
+
         processes.append(mp.Process(target=self.start_activity_detection,
-                                    args=(playground, ai_frame_queue, detection_queues, detection_screen_queue,
-                                          class_id, network_config, network_weights, coco_config, width, height,
-                                          cameras, polygons, len(video_addresses), debugging)))
+                                    args=(playground, result_queue, detection_queues, detection_screen_queue,
+                                          width, height, cameras, polygons, len(video_addresses), ai_frame_rings,
+                                          detector_workers, batch_size, last_detections, shared_tracks,
+                                          track_max_age, track_roi, debugging)))
 
         video_screen_queue = mp.Queue(2000)
         screen_queues.append(video_screen_queue)
@@ -219,8 +338,9 @@ class Record(object):
         # Create video rendering thread
         processes.append(mp.Process(target=self.start_video_making,
                                     args=(playground, video_frame_queue, video_screen_queue,
-                                          detection_queues[len(detection_queues) - 1], output_video, video_latency,
-                                          polygons, width, height, fps, debugging)))
+                                          detection_queues[len(detection_queues) - 1], output_video, streaming_path,
+                                          video_latency, polygons, width, height, fps, cameras, frame_rings,
+                                          debugging)))
 
         # Start the processes
         started_at = time.time()
@@ -296,8 +416,10 @@ class Record(object):
 
                 self.files_cleanup(session_path, streaming_path, video_making_path)
         finally:
-            sch.empty_queue(ai_frame_queue)
-            sch.empty_queue(video_frame_queue)
+            sch.empty_queue(ai_frame_queue, ai_frame_rings)
+            sch.empty_queue(video_frame_queue, frame_rings)
+            for frame_ring in frame_rings + ai_frame_rings:
+                frame_ring.destroy()
 
     @staticmethod
     def files_cleanup(session_path: str, streaming_path: str, video_making_path: str):
@@ -306,6 +428,8 @@ class Record(object):
         shutil.rmtree(video_making_path)
 
     def dump_screen_information(self, screen_queues: List[mp.Queue]):
+        # Wait on the pipes of all screen queues at once, instead of polling them one by one
+        readers = {screen_queue._reader: screen_queue for screen_queue in screen_queues}
         dumping_screen_information = True
         while dumping_screen_information:
             with self.dumping_screen_information_lock:
@@ -313,23 +437,23 @@ class Record(object):
 
             try:
                 # If there is any incoming message
-                for screen_queue in screen_queues:
-                    if screen_queue.qsize() > 0:
+                for reader in connection.wait(list(readers.keys()), timeout=0.5):
+                    try:
                         # Receive the message
-                        events: List[RecordScreenInfoEventItem] = screen_queue.get()
-
-                        for information in events:
-                            if information.operation == RecordScreenInfoOperation.ADD:
-                                self.screen_info.increment_item_value(information.type, information.value)
-                            else:
-                                self.screen_info.set_item_value(information.type, information.value)
-
-                            if information.type == RecordScreenInfo.ERROR_LOG:
-                                self.logger.error(information)
-                            else:
-                                self.logger.info(information)
-                    else:
-                        time.sleep(0.01)
+                        events: List[RecordScreenInfoEventItem] = readers[reader].get_nowait()
+                    except queue.Empty:
+                        continue
+
+                    for information in events:
+                        if information.operation == RecordScreenInfoOperation.ADD:
+                            self.screen_info.increment_item_value(information.type, information.value)
+                        else:
+                            self.screen_info.set_item_value(information.type, information.value)
+
+                        if information.type == RecordScreenInfo.ERROR_LOG:
+                            self.logger.error(information)
+                        else:
+                            self.logger.info(information)
             finally:
                 pass
 
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+import multiprocessing as mp
+
+
+class AdaptiveSampler(object):
+    """
+    Decides which frames of the camera are sent to Detector. The detector budget (frames per second of all cameras)
+    is shared among the cameras which are not active, since the frames of the active camera are never detected.
+    Each of them gets at least the minimal rate, while the rest of the budget goes to the cameras with the ball
+    detected within the activity window, up to the maximal rate.
+    Detector writes the monotonic time of the last detection of each camera into the shared array.
+    """
+    # How often the rate is recalculated, in seconds
+    REFRESH_INTERVAL: float = 0.5
+
+    def __init__(self, camera_id: int, last_detections: mp.Array, budget: float, min_cdfps: float, max_cdfps: float,
+                 activity_window: float):
+        self.camera_id = camera_id
+        self.last_detections = last_detections
+        self.budget = budget
+        self.min_cdfps = min_cdfps
+        self.max_cdfps = max_cdfps
+        self.activity_window = activity_window
+
+        self.cdfps = min_cdfps
+        self.refreshed_at = 0
+        self.sampled_at = 0
+
+    def is_candidate(self, timestamp: int, active_camera_id: int) -> bool:
+        # Timestamp is the monotonic time of the frame in milliseconds
+        now = timestamp / 1000
+        if now - self.refreshed_at >= self.REFRESH_INTERVAL:
+            self.refreshed_at = now
+            self.cdfps = self.get_rate(now, active_camera_id)
+
+        if self.cdfps > 0 and now - self.sampled_at >= 1 / self.cdfps:
+            self.sampled_at = now
+            return True
+        return False
+
+    def get_rate(self, now: float, active_camera_id: int) -> float:
+        if self.camera_id == active_camera_id:
+            return 0
+
+        with self.last_detections.get_lock():
+            last_detections = list(self.last_detections.get_obj())
+
+        candidates = [i + 1 for i in range(len(last_detections)) if i + 1 != active_camera_id]
+        if len(candidates) == 0:
+            return 0
+
+        # Cameras with the recent activity share what is left of the budget, while the idle ones stay at the minimum
+        busy = [c for c in candidates if now - last_detections[c - 1] <= self.activity_window]
+        spare = max(self.budget - self.min_cdfps * len(candidates), 0)
+        if self.camera_id in busy:
+            return min(self.min_cdfps + spare / len(busy), self.max_cdfps)
+        return self.min_cdfps
@@ -1,37 +1,67 @@
 #!/usr/bin/env python3
 from threading import Lock
 import time
-import math
+import queue
 import cv2
-import numpy as np
+from collections import deque
 import multiprocessing as mp
+from typing import List
 from Shared.SharedFunctions import SharedFunctions
 from Shared.CvFunctions import CvFunctions
 from Shared.Camera import Camera
 from Shared.CapturedFrame import CapturedFrame, SharedCapturedFrameHandler as sch
+from Shared.SharedFrameRing import SharedFrameRing
+from Shared.CapturedFrame import SharedCapturedFrame
+from Shared.CameraSwitchTimeline import CameraSwitchTimeline
+from Recorder.AdaptiveSampler import AdaptiveSampler
+from ActivityDetector.MotionGate import MotionGate
 from Shared.RecordScreenInfo import RecordScreenInfo
 from Shared.RecordScreenInfoEventItem import RecordScreenInfoEventItem
 from Shared.RecordScreenInfoOperation import RecordScreenInfoOperation
 
 
 class VideoRecorder(object):
-    VIDEO: str = "video"
-    AI: str = "ai"
+    # How long the end of the camera waits for the space in the full queue, in seconds
+    END_TIMEOUT: float = 5
 
     def __init__(self, camera: Camera, ai_frame_queue: mp.Queue, video_frame_queue: mp.Queue, screen_queue: mp.Queue,
-                 detection_queue: mp.Queue, debugging: bool):
+                 detection_queue: mp.Queue, frame_rings: List[SharedFrameRing], ai_frame_rings: List[SharedFrameRing],
+                 ai_drop_policy: str, video_drop_policy: str, video_latency: float, sampler: AdaptiveSampler,
+                 motion_gate: MotionGate, debugging: bool):
         self.camera = camera
         self.ai_frame_queue = ai_frame_queue
         self.video_frame_queue = video_frame_queue
+        # Rings of all cameras are needed, since the frame of any camera might be dropped from the full queue
+        self.frame_rings = frame_rings
+        self.ai_frame_rings = ai_frame_rings
+        self.frame_ring = frame_rings[camera.id - 1]
+        self.ai_frame_ring = ai_frame_rings[camera.id - 1]
+        # Unless AI frames are downscaled into a ring of their own, they share the slots of the video frames
+        self.sharing_ai_frames = self.ai_frame_ring.name == self.frame_ring.name
+        self.ai_drop_policy = ai_drop_policy
+        self.video_drop_policy = video_drop_policy
+        self.dropped_ai_frames = 0
+        self.dropped_video_frames = 0
         self.screen_queue = screen_queue
         self.detection_queue = detection_queue
-        self.detection_frequency = math.floor(camera.fps / camera.cdfps)
+        # Detection rate of the camera follows the activity of all cameras
+        self.sampler = sampler
+        # Candidates without any motion inside the detection areas are not sent to Detector.
+        # The camera process sees all candidates of the camera, so its background model is the only one.
+        self.motion_gate = motion_gate
+        self.skipped_ai_frames = 0
         self.debugging = debugging
 
         # We assume that the active camera is 1
         self.active_camera_id = 1
         self.active_detection = None
 
+        # Video frames are held back for the save delay, so that only the frames of the camera,
+        # which was active at the time they were grabbed, are sent to VideoMaker
+        self.lookahead = deque()
+        self.lookahead_delay = int(video_latency * 1000)
+        self.camera_timeline = CameraSwitchTimeline(self.active_camera_id)
+
     def start(self):
         # Sync the start with other cameras, so they start at the same time
         while self.camera.start_of_capture > time.time():
@@ -80,44 +110,45 @@ class VideoRecorder(object):
                         frame_number = 1
 
                     snapshot_time = time.time()
-
-                    # Determine if the frame is a detection candidate.
-                    detection_candidate = frame_number % self.detection_frequency == 1
+                    timestamp = int(time.monotonic() * 1000)
 
                     # Get the frame itself
                     ref, frame = capture.retrieve()
+                    capture_time = SharedFunctions.get_capture_time(self.camera.start_of_capture,
+                                                                    capture.get(cv2.CAP_PROP_POS_MSEC))
 
                     # Check if the camera activity has changed
                     self.check_active_detection()
 
                     # Detection candidate should be handled by Detector, that will send an active camera change
-                    # message, short time after, so that a correct image in video_queue can be written to the stream
-                    # Note that we are passing the copy of the image, to avoid it being freed by video maker process
-                    if detection_candidate and self.active_camera_id != self.camera.id:
-                        captured_frame = CapturedFrame(self.camera,
-                                                       frame_number,
-                                                       snapshot_time,
-                                                       np.copy(frame),
-                                                       SharedFunctions.get_recording_time(
-                                                           self.camera.start_of_capture,
-                                                           capture.get(cv2.CAP_PROP_POS_MSEC)))
-
-                        self.ai_frame_queue.put_nowait(sch.get_shared_frame(captured_frame,
-                                                                            self.AI))
+                    # message, short time after, so that a correct image in video_queue can be written to the stream.
+                    # Frames of the active camera are never candidates.
+                    ai_candidate = self.sampler.is_candidate(timestamp, self.active_camera_id)
+                    if ai_candidate and not self.motion_gate.is_moving(self.camera.id, frame):
+                        ai_candidate = False
+                        self.skipped_ai_frames += 1
+
+                    captured_frame = CapturedFrame(self.camera, frame_number, timestamp, capture_time, frame)
+                    if self.sharing_ai_frames:
+                        # The frame is written to shared memory once, and the same slot is published to both
+                        # Detector and VideoMaker. After a camera switch, the frames of the new active camera,
+                        # which were candidates before, might still be read by Detector, so VideoMaker draws over
+                        # the copy of the frame, while the slot has the other reference.
+                        shared_captured_frame = sch.get_shared_frame(captured_frame,
+                                                                     self.frame_ring,
+                                                                     2 if ai_candidate else 1)
+                        if ai_candidate:
+                            self.publish_ai_frame(shared_captured_frame)
+                        self.publish_video_frame(shared_captured_frame)
+                    else:
+                        # Detector gets the frame downscaled to the AI frame size
+                        if ai_candidate:
+                            self.publish_ai_frame(sch.get_shared_frame(captured_frame, self.ai_frame_ring))
+                        self.publish_video_frame(sch.get_shared_frame(captured_frame, self.frame_ring))
 
                     if self.debugging:
                         print("TOTAL FRAMES GRABBED {}".format(total_frames))
 
-                    self.video_frame_queue.put_nowait(
-                        sch.get_shared_frame(CapturedFrame(self.camera,
-                                                           frame_number,
-                                                           snapshot_time,
-                                                           frame,
-                                                           SharedFunctions.get_recording_time(
-                                                               self.camera.start_of_capture,
-                                                               capture.get(
-                                                                   cv2.CAP_PROP_POS_MSEC))), self.VIDEO))
-
                 if total_frames % (self.camera.fps * 2) == 0:
                     self.screen_queue.put_nowait([RecordScreenInfoEventItem(RecordScreenInfo.VR_HEART_BEAT,
                                                                             RecordScreenInfoOperation.SET,
@@ -127,8 +158,23 @@ class VideoRecorder(object):
                                                                             self.video_frame_queue.qsize()),
                                                  RecordScreenInfoEventItem(RecordScreenInfo.AI_QUEUE_COUNT,
                                                                            RecordScreenInfoOperation.SET,
-                                                                           self.ai_frame_queue.qsize())
+                                                                           self.ai_frame_queue.qsize()),
+                                                  RecordScreenInfoEventItem(RecordScreenInfo.VR_RING_OCCUPANCY,
+                                                                            RecordScreenInfoOperation.SET,
+                                                                            self.get_ring_occupancy()),
+                                                  RecordScreenInfoEventItem(RecordScreenInfo.VR_DROPPED_AI_FRAMES,
+                                                                            RecordScreenInfoOperation.ADD,
+                                                                            self.dropped_ai_frames),
+                                                  RecordScreenInfoEventItem(RecordScreenInfo.VR_DROPPED_VIDEO_FRAMES,
+                                                                            RecordScreenInfoOperation.ADD,
+                                                                            self.dropped_video_frames),
+                                                  RecordScreenInfoEventItem(RecordScreenInfo.AI_SKIPPED_FRAMES,
+                                                                            RecordScreenInfoOperation.ADD,
+                                                                            self.skipped_ai_frames)
                                                   ])
+                    self.dropped_ai_frames = 0
+                    self.dropped_video_frames = 0
+                    self.skipped_ai_frames = 0
 
             self.screen_queue.put_nowait([RecordScreenInfoEventItem(RecordScreenInfo.CURRENT_TASK,
                                                                     RecordScreenInfoOperation.SET,
@@ -159,8 +205,10 @@ class VideoRecorder(object):
             if capture is not None:
                 capture.release()
             CvFunctions.release_open_cv()
-            self.ai_frame_queue.put_nowait(None)
-            self.video_frame_queue.put_nowait(None)
+            self.forward_video_frames(True)
+            # The end is what stops the consumers, so it waits for the space in the full queue
+            self.ai_frame_queue.put(None, timeout=self.END_TIMEOUT)
+            self.video_frame_queue.put(None, timeout=self.END_TIMEOUT)
             print("TOTAL FRAMES GRABBED: {}".format(total_frames))
         except Exception as ex:
             pass
@@ -175,12 +223,54 @@ class VideoRecorder(object):
                                                                 .format(self.camera.id, self.camera.playground))
                                       ])
 
+    def publish_ai_frame(self, shared_captured_frame: SharedCapturedFrame):
+        # Frame is missing if there was no free slot in the ring
+        if shared_captured_frame is None:
+            self.dropped_ai_frames += 1
+        else:
+            self.dropped_ai_frames += sch.put_frame(self.ai_frame_queue,
+                                                    shared_captured_frame,
+                                                    self.ai_frame_rings,
+                                                    self.ai_drop_policy,
+                                                    self.active_camera_id)
+
+    def publish_video_frame(self, shared_captured_frame: SharedCapturedFrame):
+        if shared_captured_frame is None:
+            self.dropped_video_frames += 1
+        else:
+            self.lookahead.append(shared_captured_frame)
+        self.forward_video_frames(False)
+
+    def forward_video_frames(self, flush: bool):
+        now = int(time.monotonic() * 1000)
+        while len(self.lookahead) > 0 and (flush or now - self.lookahead[0].timestamp >= self.lookahead_delay):
+            shared_captured_frame: SharedCapturedFrame = self.lookahead.popleft()
+            if self.camera_timeline.camera_at(shared_captured_frame.timestamp) == self.camera.id:
+                # Camera which was active at the time of the frame, might have become inactive since,
+                # and then its frames are the first to be dropped from the full queue
+                self.dropped_video_frames += sch.put_frame(self.video_frame_queue,
+                                                           shared_captured_frame,
+                                                           self.frame_rings,
+                                                           self.video_drop_policy,
+                                                           self.active_camera_id)
+            else:
+                # Frame of the inactive camera would never be written, so it is not sent to VideoMaker
+                sch.release(shared_captured_frame, self.frame_ring)
+
+    def get_ring_occupancy(self) -> str:
+        occupancy = "Camera {} - {}/{}".format(self.camera.id, self.frame_ring.occupancy(), self.frame_ring.slots)
+        if not self.sharing_ai_frames:
+            occupancy += ", AI {}/{}".format(self.ai_frame_ring.occupancy(), self.ai_frame_ring.slots)
+        return occupancy
+
     def check_active_detection(self):
         # Check if there is a message from Detector that active camera has changed
         try:
-            if self.detection_queue.qsize() > 0:
-                self.active_detection = self.detection_queue.get()
-                self.active_camera_id = self.active_detection.camera_id
+            self.active_detection = self.detection_queue.get_nowait()
+            self.active_camera_id = self.active_detection.camera_id
+            self.camera_timeline.add(self.active_detection)
+        except queue.Empty:
+            pass
         except Exception as ex:
             raise ex
         finally:
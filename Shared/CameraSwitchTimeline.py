@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+from collections import deque
+from Shared.Detection import Detection
+
+
+class CameraSwitchTimeline(object):
+    """
+    Camera switches reported by Detector, ordered by the timestamp of the frame which caused them.
+    It answers which camera was active at the time the frame was grabbed, as long as it is asked
+    about the frames in the order they were grabbed.
+    """
+    def __init__(self, active_camera_id: int = 1):
+        self.active_camera_id = active_camera_id
+        self.switches = deque()
+
+    def add(self, detection: Detection):
+        self.switches.append((detection.camera_time, detection.camera_id))
+
+    def camera_at(self, timestamp: int) -> int:
+        while len(self.switches) > 0 and self.switches[0][0] <= timestamp:
+            self.active_camera_id = self.switches.popleft()[1]
+        return self.active_camera_id
@@ -1,73 +1,109 @@
 #!/usr/bin/env python3
 import time
+import cv2
 import Shared.Camera as Camera
 import numpy as np
-import SharedArray as sa
+import queue
 import multiprocessing as mp
-import uuid
+from typing import List
+from Shared.SharedFrameRing import SharedFrameRing
+from Shared.FrameDropPolicy import FrameDropPolicy
 
 
 class CapturedFrame(object):
-    def __init__(self, camera: Camera, frame_number: int, snapshot_time: time, frame: np.array, camera_time: time):
+    def __init__(self, camera: Camera, frame_number: int, timestamp: int, capture_time: int, frame: np.array):
         self.camera = camera
         self.frame_number = frame_number
-        self.timestamp = int(snapshot_time) + float(frame_number / 1000)
-        self.snapshot_time = snapshot_time
+        # Monotonic time of the grab, and the camera time, both expressed in milliseconds
+        self.timestamp = timestamp
+        self.capture_time = capture_time
         self.frame = frame
-        self.camera_time = camera_time
+
+    @property
+    def snapshot_time(self) -> float:
+        return self.capture_time / 1000
+
+    @property
+    def camera_time(self) -> time:
+        return time.localtime(self.capture_time / 1000)
 
     def release(self):
         self.frame = None
 
 
+class SharedFrameLease(CapturedFrame):
+    """
+    Captured frame, whose frame is a view straight onto the shared memory slot.
+    The slot is returned to the ring once the lease is released, or when leaving the with block.
+    """
+    def __init__(self, camera: Camera, frame_number: int, timestamp: int, capture_time: int, frame: np.array,
+                 ring: SharedFrameRing, slot: int, generation: int):
+        super().__init__(camera, frame_number, timestamp, capture_time, frame)
+        self.ring = ring
+        self.slot = slot
+        self.generation = generation
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def detach(self) -> CapturedFrame:
+        # Copies the frame out of shared memory, so that it can be used after the lease is released
+        return CapturedFrame(self.camera, self.frame_number, self.timestamp, self.capture_time, self.frame.copy())
+
+    def release(self):
+        if self.frame is not None:
+            self.frame = None
+            self.ring.release(self.slot, self.generation)
+
+
 class SharedCapturedFrame(object):
-    def __init__(self, camera: Camera, frame_number: int, snapshot_time: time, camera_time: time, name_prefix: str,
-                 size, channels: int):
-        self.camera = camera
+    """
+    Compact descriptor of the frame in the camera's frame ring, which is sent through the queues.
+    The camera is referenced by its id only, since the processes receive the cameras at startup.
+    """
+    __slots__ = ("camera_id", "slot", "generation", "frame_number", "timestamp", "capture_time")
+
+    def __init__(self, camera_id: int, slot: int, generation: int, frame_number: int, timestamp: int,
+                 capture_time: int):
+        self.camera_id = camera_id
+        self.slot = slot
+        self.generation = generation
         self.frame_number = frame_number
-        self.timestamp = int(snapshot_time) + float(frame_number / 1000)
-        self.snapshot_time = snapshot_time
-        self.camera_time = camera_time
-
-        self.id = "shm://camera_{camera}_" \
-                  "{name_prefix}" \
-                  "{camera_time}_" \
-                  "{frame_number}_" \
-                  "{random}".format(camera=camera.id,
-                                    name_prefix=name_prefix,
-                                    frame_number=frame_number,
-                                    camera_time=int(time.mktime(camera_time) * 10000000000),
-                                    random=time.time())
-        self.channels = channels
-        self.size = size
+        self.timestamp = timestamp
+        self.capture_time = capture_time
+
+    def __reduce__(self):
+        # Pickle as a plain tuple of integers
+        return SharedCapturedFrame, (self.camera_id,
+                                     self.slot,
+                                     self.generation,
+                                     self.frame_number,
+                                     self.timestamp,
+                                     self.capture_time)
 
 
 class SharedCapturedFrameHandler(object):
     @staticmethod
-    def get_frame(shared_captured_frame: SharedCapturedFrame) -> (bool, CapturedFrame):
-        try:
-            if shared_captured_frame is not None:
-                frame = sa.attach(shared_captured_frame.id)
-                captured_frame: CapturedFrame = CapturedFrame(shared_captured_frame.camera,
-                                                              shared_captured_frame.frame_number,
-                                                              shared_captured_frame.snapshot_time,
-                                                              frame.copy(),
-                                                              shared_captured_frame.camera_time)
-                SharedCapturedFrameHandler.release(shared_captured_frame)
-                return captured_frame
-            else:
-                return False, None
-        except Exception as ex:
-            pass
-        finally:
-            pass
-        return False, None
+    def lease(shared_captured_frame: SharedCapturedFrame, ring: SharedFrameRing, camera: Camera) -> SharedFrameLease:
+        if shared_captured_frame is None:
+            return None
+        return SharedFrameLease(camera,
+                                shared_captured_frame.frame_number,
+                                shared_captured_frame.timestamp,
+                                shared_captured_frame.capture_time,
+                                ring.view(shared_captured_frame.slot),
+                                ring,
+                                shared_captured_frame.slot,
+                                shared_captured_frame.generation)
 
     @staticmethod
-    def release(shared_captured_frame: SharedCapturedFrame):
+    def release(shared_captured_frame: SharedCapturedFrame, ring: SharedFrameRing):
         try:
             if shared_captured_frame is not None:
-                sa.delete(shared_captured_frame.id)
+                ring.release(shared_captured_frame.slot, shared_captured_frame.generation)
         except Exception as ex:
             pass
         finally:
@@ -75,22 +111,32 @@ class SharedCapturedFrameHandler(object):
         return False, None
 
     @staticmethod
-    def get_shared_frame(captured_frame: CapturedFrame, name_prefix) -> SharedCapturedFrame:
+    def get_shared_frame(captured_frame: CapturedFrame, ring: SharedFrameRing,
+                         consumers: int = 1) -> SharedCapturedFrame:
         try:
             if captured_frame is not None:
-                shared_captured_frame: SharedCapturedFrame = SharedCapturedFrame(captured_frame.camera,
-                                                                                 captured_frame.frame_number,
-                                                                                 captured_frame.snapshot_time,
-                                                                                 captured_frame.camera_time,
-                                                                                 name_prefix,
-                                                                                 captured_frame.frame.shape[:2],
-                                                                                 captured_frame.frame.shape[2])
-
-                shared_array = sa.create(shared_captured_frame.id,
-                                         captured_frame.frame.shape,
-                                         captured_frame.frame.dtype)
-                np.copyto(shared_array, captured_frame.frame)
-                return shared_captured_frame
+                # The slot is recycled once each of the consumers has released it.
+                # If all the slots are still in use by the consumers, the frame is not shared
+                acquired = ring.acquire(consumers)
+                if acquired is None:
+                    return None
+
+                slot, generation = acquired
+                shared_frame = ring.view(slot)
+                if shared_frame.shape == captured_frame.frame.shape:
+                    np.copyto(shared_frame, captured_frame.frame)
+                else:
+                    # The ring holds the downscaled frames, so the frame is resized straight into the slot
+                    cv2.resize(captured_frame.frame,
+                               (shared_frame.shape[1], shared_frame.shape[0]),
+                               dst=shared_frame,
+                               interpolation=cv2.INTER_AREA)
+                return SharedCapturedFrame(captured_frame.camera.id,
+                                           slot,
+                                           generation,
+                                           captured_frame.frame_number,
+                                           captured_frame.timestamp,
+                                           captured_frame.capture_time)
             else:
                 return None
         except Exception as ex:
@@ -99,12 +145,55 @@ class SharedCapturedFrameHandler(object):
             pass
 
     @staticmethod
-    def empty_queue(queue: mp.Queue):
+    def put_frame(frame_queue: mp.Queue, shared_captured_frame: SharedCapturedFrame, rings: List[SharedFrameRing],
+                  policy: str, active_camera_id: int) -> int:
+        # Puts the frame into the bounded queue, and returns the number of frames dropped to achieve that
+        try:
+            frame_queue.put_nowait(shared_captured_frame)
+            return 0
+        except queue.Full:
+            pass
+
+        ring = rings[shared_captured_frame.camera_id - 1]
+        if policy == FrameDropPolicy.DROP_NEWEST or \
+                (policy == FrameDropPolicy.DROP_INACTIVE_FIRST and
+                 shared_captured_frame.camera_id != active_camera_id):
+            SharedCapturedFrameHandler.release(shared_captured_frame, ring)
+            return 1
+
+        # Make space for the new frame, by releasing the oldest one
+        try:
+            oldest_frame: SharedCapturedFrame = frame_queue.get_nowait()
+        except queue.Empty:
+            oldest_frame = None
+        else:
+            if oldest_frame is None:
+                # End of the stream of another camera must not be lost, so the new frame is dropped instead
+                SharedCapturedFrameHandler.release(shared_captured_frame, ring)
+                try:
+                    frame_queue.put_nowait(None)
+                except queue.Full:
+                    pass
+                return 1
+            SharedCapturedFrameHandler.release(oldest_frame, rings[oldest_frame.camera_id - 1])
+
+        dropped = 0 if oldest_frame is None else 1
+        try:
+            frame_queue.put_nowait(shared_captured_frame)
+        except queue.Full:
+            # Other camera has taken the space in the meantime
+            SharedCapturedFrameHandler.release(shared_captured_frame, ring)
+            dropped += 1
+        return dropped
+
+    @staticmethod
+    def empty_queue(queue: mp.Queue, rings: List[SharedFrameRing]):
         while queue.qsize() > 0:
             try:
                 shared_captured_frame: SharedCapturedFrame = queue.get()
                 if shared_captured_frame is not None:
-                    SharedCapturedFrameHandler.release(shared_captured_frame)
+                    SharedCapturedFrameHandler.release(shared_captured_frame,
+                                                       rings[shared_captured_frame.camera_id - 1])
             except:
                 pass
 
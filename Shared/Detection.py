@@ -1,5 +1,4 @@
 #!/usr/bin/env python3
-import time
 from Shared.Point import Point
 from Shared.SharedFunctions import SharedFunctions
 from Polygon import Polygon
@@ -7,8 +6,15 @@ from typing import List
 
 
 class Detection(object):
+    """
+    Compact record of the detected ball, holding only numbers, which is sent through the detection queues.
+    Geometry of the box is derived only when it is drawn.
+    """
+    __slots__ = ("left", "right", "top", "bottom", "width", "height", "confidence", "camera_id", "frame_number",
+                 "camera_time")
+
     def __init__(self, left: int, right: int, top: int, bottom: int, width: int, height: int,
-                 confidence: float, camera_id: int, frame_number: float, camera_time: time):
+                 confidence: float, camera_id: int, frame_number: float, camera_time: int):
         self.camera_id = camera_id
         self.left = left
         self.right = right
@@ -19,9 +25,27 @@ class Detection(object):
         self.confidence = confidence
         self.frame_number = frame_number
         self.camera_time = camera_time
-        self.points: List[Point] = [Point(self.left, self.top),
-                                    Point(self.left, self.bottom),
-                                    Point(self.right, self.bottom),
-                                    Point(self.right, self.top)]
 
-        self.polygon = Polygon(SharedFunctions.get_points_array(self.points))
+    @property
+    def points(self) -> List[Point]:
+        return [Point(self.left, self.top),
+                Point(self.left, self.bottom),
+                Point(self.right, self.bottom),
+                Point(self.right, self.top)]
+
+    @property
+    def polygon(self) -> Polygon:
+        return Polygon(SharedFunctions.get_points_array(self.points))
+
+    def __reduce__(self):
+        # Pickle as a plain tuple of numbers
+        return Detection, (self.left,
+                           self.right,
+                           self.top,
+                           self.bottom,
+                           self.width,
+                           self.height,
+                           self.confidence,
+                           self.camera_id,
+                           self.frame_number,
+                           self.camera_time)
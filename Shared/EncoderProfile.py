@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+from Shared.SharedFunctions import SharedFunctions
+
+
+class EncoderProfile(object):
+    # Hardware H.264 encoder of the Jetson board, fed through the NVMM memory
+    JETSON: str = "jetson"
+    # Software H.264 encoder of GStreamer, available on any Linux box
+    X264: str = "x264"
+    # Built-in writer of OpenCV, without GStreamer
+    OPENCV: str = "opencv"
+
+    PROFILES = [JETSON, X264, OPENCV]
+
+    @staticmethod
+    def from_config(value: str) -> str:
+        return SharedFunctions.get_config_choice(value, EncoderProfile.PROFILES, "encoder profile")
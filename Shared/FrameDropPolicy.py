@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+from Shared.SharedFunctions import SharedFunctions
+
+
+class FrameDropPolicy(object):
+    # Frame which doesn't fit into the full queue is dropped
+    DROP_NEWEST: str = "drop-newest"
+    # The oldest frame in the full queue is dropped, to make space for the new one
+    DROP_OLDEST: str = "drop-oldest"
+    # Frame of the inactive camera is dropped, while the frame of the active camera replaces the oldest one
+    DROP_INACTIVE_FIRST: str = "drop-inactive-first"
+
+    POLICIES = [DROP_NEWEST, DROP_OLDEST, DROP_INACTIVE_FIRST]
+
+    @staticmethod
+    def from_config(value: str) -> str:
+        return SharedFunctions.get_config_choice(value, FrameDropPolicy.POLICIES, "frame drop policy")
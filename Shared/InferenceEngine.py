@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+from Shared.SharedFunctions import SharedFunctions
+
+
+class InferenceEngine(object):
+    # Darknet library, built for the GPU of the Jetson board
+    DARKNET: str = "darknet"
+    # OpenCV DNN module, running the darknet network on the CPU
+    OPENCV: str = "opencv"
+    # ONNX Runtime, running the exported network on the CPU
+    ONNX: str = "onnx"
+
+    ENGINES = [DARKNET, OPENCV, ONNX]
+
+    @staticmethod
+    def from_config(value: str) -> str:
+        return SharedFunctions.get_config_choice(value, InferenceEngine.ENGINES, "inference engine")
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+from Shared.SharedFunctions import SharedFunctions
+
+
+class InferenceMode(object):
+    # The whole frame is detected at once
+    FULL: str = "full"
+    # Frame is cropped to the bounding box of the camera's detection areas
+    ZONE: str = "zone"
+    # Cropped region is split into overlapping tiles, detected in one batch
+    TILES: str = "tiles"
+
+    MODES = [FULL, ZONE, TILES]
+
+    @staticmethod
+    def from_config(value: str) -> str:
+        return SharedFunctions.get_config_choice(value, InferenceMode.MODES, "inference mode")
@@ -4,63 +4,97 @@ import time
 
 
 class LogoRenderer(object):
-    @staticmethod
-    def draw_logo(background: np.ndarray, overlay: np.ndarray, date_format: str, time_format: str, camera_time: time):
-        rect_overlay = background.copy()
-        rows, cols, channels = overlay.shape
-
-        brows, bcols, bchannels = background.shape
-        multiplier = bcols / 1280
-
-        edge = int(10 * multiplier)
-        logo_start_y = int(20 * multiplier)
-        logo_end_y = int(20 * multiplier) + rows
-        logo_start_x = int(20 * multiplier)
-        logo_end_x = int(20 * multiplier) + cols
+    """
+    Draws the logo with the date and time over the top left corner of the frame, in place.
+    The layout, the logo and the float buffers are prepared once per resolution, and the text is rendered
+    into small alpha strips once per second, so that each frame only blends the few pixels of the overlay.
+    """
+    def __init__(self, overlay: np.ndarray, date_format: str, time_format: str):
+        self.overlay = overlay
+        self.date_format = date_format
+        self.time_format = time_format
+
+        self.shape = None
+        self.multiplier = 1.0
+        self.rect = None
+        self.logo = None
+        self._overlay = None
+        self._rect = None
+
+        # Text strips of the last rendered second
+        self.text_time = None
+        self.text_strips = []
+
+    def prepare(self, shape: tuple):
+        rows, cols, channels = self.overlay.shape
+
+        brows, bcols, bchannels = shape
+        self.shape = shape
+        self.multiplier = bcols / 1280
+
+        edge = int(10 * self.multiplier)
+        logo_start_y = int(20 * self.multiplier)
+        logo_start_x = int(20 * self.multiplier)
 
         rect_start_x = logo_start_x - edge
-        rect_end_x = logo_start_x + cols + int(100 * multiplier) + edge
+        rect_end_x = logo_start_x + cols + int(100 * self.multiplier) + edge
         rect_start_y = logo_start_x - edge
         rect_end_y = logo_start_y + rows + edge
-
-        cv2.rectangle(background, (rect_start_x, rect_start_y), (rect_end_x, rect_end_y), (0, 0, 0), -1)
-        modified_rect_overlay = cv2.addWeighted(rect_overlay[rect_start_y:rect_end_y, rect_start_x:rect_end_x], 0.2,
-                                                background[rect_start_y:rect_end_y, rect_start_x:rect_end_x], 0.8, 0)
-        background[rect_start_y:rect_end_y, rect_start_x:rect_end_x] = modified_rect_overlay.copy()
-        modified_rect_overlay = None
-        del modified_rect_overlay
-
-        modified_overlay = cv2.addWeighted(background[logo_start_y:logo_end_y,
-                                           logo_start_x:logo_end_x],
-                                           1,
-                                           overlay,
-                                           1,
-                                           0)
-        background[logo_start_y:logo_end_y, logo_start_x:logo_end_x] = modified_overlay.copy()
-        modified_overlay = None
-        del modified_overlay
-
-        cv2.putText(background,
-                    time.strftime(date_format, camera_time),
-                    (int(150 * multiplier),
-                     int(34 * multiplier)),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.5 * multiplier,
-                    (255, 255, 255),
-                    1,
-                    cv2.LINE_AA,
-                    False)
-
-        cv2.putText(background,
-                    time.strftime(time_format, camera_time),
-                    (int(159 * multiplier),
-                     int(60 * multiplier)),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.5 * multiplier,
-                    (255, 255, 255),
-                    1,
-                    cv2.LINE_AA,
-                    False)
+        self.rect = (rect_start_x, rect_start_y, rect_end_x, rect_end_y)
+        # Logo position relative to the rectangle
+        self.logo = (logo_start_x - rect_start_x, logo_start_y - rect_start_y,
+                     logo_start_x - rect_start_x + cols, logo_start_y - rect_start_y + rows)
+
+        self._overlay = self.overlay.astype(np.float32)
+        self._rect = np.empty((rect_end_y - rect_start_y, rect_end_x - rect_start_x, 3), dtype=np.float32)
+
+    def draw(self, background: np.ndarray, camera_time: time.struct_time):
+        if self.shape != background.shape:
+            self.prepare(background.shape)
+
+        # Rectangle behind the logo is darkened to 20%, and the logo is added over it
+        rect_start_x, rect_start_y, rect_end_x, rect_end_y = self.rect
+        rect = background[rect_start_y:rect_end_y, rect_start_x:rect_end_x]
+        np.multiply(rect, np.float32(0.2), out=self._rect, dtype=np.float32)
+        logo_start_x, logo_start_y, logo_end_x, logo_end_y = self.logo
+        logo = self._rect[logo_start_y:logo_end_y, logo_start_x:logo_end_x]
+        np.add(logo, self._overlay, out=logo)
+        np.minimum(logo, 255, out=logo)
+        np.add(self._rect, 0.5, out=self._rect)
+        rect[...] = self._rect
+
+        # White text is blended through its cached alpha strip
+        if self.text_time != camera_time[:6]:
+            self.render_text(camera_time, background.shape)
+        for x, y, alpha, white, buffer in self.text_strips:
+            strip = background[y:y + alpha.shape[0], x:x + alpha.shape[1]]
+            np.multiply(strip, alpha, out=buffer, dtype=np.float32)
+            np.add(buffer, white, out=buffer)
+            strip[...] = buffer
+
+    def render_text(self, camera_time: time.struct_time, shape: tuple):
+        self.text_time = camera_time[:6]
+        self.text_strips = []
+        for text, origin in [(time.strftime(self.date_format, camera_time),
+                               (int(150 * self.multiplier), int(34 * self.multiplier))),
+                              (time.strftime(self.time_format, camera_time),
+                               (int(159 * self.multiplier), int(60 * self.multiplier)))]:
+            scale = 0.5 * self.multiplier
+            (width, height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, 1)
+
+            # Strip covers the text with the antialiased border, clipped to the frame
+            pad = 2
+            x = max(origin[0] - pad, 0)
+            y = max(origin[1] - height - pad, 0)
+            end_x = min(origin[0] + width + pad, shape[1])
+            end_y = min(origin[1] + baseline + pad, shape[0])
+            mask = np.zeros((end_y - y, end_x - x), dtype=np.uint8)
+            cv2.putText(mask, text, (origin[0] - x, origin[1] - y), cv2.FONT_HERSHEY_SIMPLEX, scale, 255, 1,
+                        cv2.LINE_AA, False)
+
+            # Pixel becomes background * (1 - alpha) + 255 * alpha
+            alpha = (mask.astype(np.float32) / 255)[:, :, np.newaxis]
+            self.text_strips.append((x, y, 1 - alpha, alpha * 255, np.empty(mask.shape + (3,), dtype=np.float32)))
 
     @staticmethod
     def image_resize(image, width=None, height=None, inter=cv2.INTER_AREA):
@@ -24,6 +24,13 @@ class RecordScreenInfo(object):
     VM_IS_LIVE: int = 19
     COMPLETED: int = 21
     VR_QUEUE_COUNT: int = 22
+    VR_RING_OCCUPANCY: int = 23
+    VR_DROPPED_AI_FRAMES: int = 24
+    VR_DROPPED_VIDEO_FRAMES: int = 25
+    AI_SKIPPED_FRAMES: int = 26
+    VM_COMPOSE_TIME: int = 27
+    VM_ENCODE_TIME: int = 28
+    VM_WRITER_QUEUE_COUNT: int = 29
 
     def __init__(self, terminal: EasyTerminal):
         self.terminal = terminal
@@ -39,6 +46,7 @@ class RecordScreenInfo(object):
             TerminalItem(terminal, self.AI_IS_LIVE, "AI - Live: ", 5),
             TerminalItem(terminal, self.AI_DETECTIONS_PER_SECOND, "AI - Detections per second: ", 5),
             TerminalItem(terminal, self.AI_QUEUE_COUNT, "AI - Queue: ", 5),
+            TerminalItem(terminal, self.AI_SKIPPED_FRAMES, "AI - Skipped Still Frames: ", 5),
             TerminalItem(terminal, self.VR_EXCEPTIONS, "VR - Exceptions: ", 5),
             TerminalItem(terminal, self.VR_RECORDING_START_SCHEDULED, "VR - Recording start scheduled: ", 5),
             TerminalItem(terminal, self.VR_RECORDING_STARTED, "VR - Recording started: ", 5),
@@ -46,10 +54,16 @@ class RecordScreenInfo(object):
             TerminalItem(terminal, self.VR_TOTAL_CAMERAS, "VR - Total Cameras: ", 5),
             TerminalItem(terminal, self.VR_HEART_BEAT, "VR - Live: ", 5),
             TerminalItem(terminal, self.VR_ACTIVE_CAMERA, "VR - Active Camera: ", 5),
+            TerminalItem(terminal, self.VR_RING_OCCUPANCY, "VR - Frame Slots: ", 40),
+            TerminalItem(terminal, self.VR_DROPPED_AI_FRAMES, "VR - Dropped AI Frames: ", 5),
+            TerminalItem(terminal, self.VR_DROPPED_VIDEO_FRAMES, "VR - Dropped Video Frames: ", 5),
             TerminalItem(terminal, self.VM_EXCEPTIONS, "VM - Exceptions: ", 5),
             TerminalItem(terminal, self.VM_WRITTEN_FRAMES, "VM - Written Frames: ", 5),
             TerminalItem(terminal, self.VM_QUEUE_COUNT, "VM - Queue: ", 5),
             TerminalItem(terminal, self.VM_IS_LIVE, "VM - Live: ", 5),
+            TerminalItem(terminal, self.VM_COMPOSE_TIME, "VM - Compose ms per Frame: ", 8),
+            TerminalItem(terminal, self.VM_ENCODE_TIME, "VM - Encode ms per Frame: ", 8),
+            TerminalItem(terminal, self.VM_WRITER_QUEUE_COUNT, "VM - Encoder Queue: ", 5),
             TerminalItem(terminal, self.CURRENT_TASK, "Current Task: ", 80),
             TerminalItem(terminal, self.COMPLETED, "Completed: ", 80)
         ]
@@ -110,4 +124,18 @@ class RecordScreenInfo(object):
             return "COMPLETED"
         if enum_value == 22:
             return "VR_QUEUE_COUNT"
+        if enum_value == 23:
+            return "VR_RING_OCCUPANCY"
+        if enum_value == 24:
+            return "VR_DROPPED_AI_FRAMES"
+        if enum_value == 25:
+            return "VR_DROPPED_VIDEO_FRAMES"
+        if enum_value == 26:
+            return "AI_SKIPPED_FRAMES"
+        if enum_value == 27:
+            return "VM_COMPOSE_TIME"
+        if enum_value == 28:
+            return "VM_ENCODE_TIME"
+        if enum_value == 29:
+            return "VM_WRITER_QUEUE_COUNT"
         return ""
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+import numpy as np
+import SharedArray as sa
+import multiprocessing as mp
+
+
+class SharedFrameRing(object):
+    """
+    Fixed number of preallocated shared memory frame slots, owned by a single camera.
+    The whole ring lives in one SharedArray segment, which is created once per session,
+    so the capture -> detector -> video maker path never allocates shared memory per frame.
+    Frames are referenced by slot index and generation, which protects the slot from stale releases.
+    """
+    def __init__(self, name: str, camera_id: int, slots: int, shape: tuple, dtype=np.uint8):
+        self.name = "shm://sports_replay_{}_camera_{}".format(name, camera_id)
+        self.camera_id = camera_id
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+        # Reference counts and generations are shared between processes, and guarded by the same lock
+        self.references = mp.Array("i", slots)
+        self.generations = mp.Array("i", slots, lock=self.references.get_lock())
+
+        self.buffer: np.ndarray = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["buffer"] = None
+        return state
+
+    def create(self):
+        # Remove the segment left over by the session that didn't end properly
+        self.destroy()
+        self.buffer = sa.create(self.name, (self.slots,) + self.shape, self.dtype)
+
+    def attach(self) -> np.ndarray:
+        if self.buffer is None:
+            self.buffer = sa.attach(self.name)
+        return self.buffer
+
+    def destroy(self):
+        try:
+            sa.delete(self.name)
+        except Exception as ex:
+            pass
+        finally:
+            self.buffer = None
+
+    def acquire(self, references: int = 1) -> (int, int):
+        # The lowest free slot is reused, so that only the slots of the frames in flight are ever touched,
+        # and the resident shared memory follows the actual occupancy, instead of the size of the ring
+        with self.references.get_lock():
+            counts = self.references.get_obj()
+            generations = self.generations.get_obj()
+            for slot in range(self.slots):
+                if counts[slot] == 0:
+                    counts[slot] = references
+                    generations[slot] += 1
+                    return slot, generations[slot]
+        return None
+
+    def release(self, slot: int, generation: int):
+        with self.references.get_lock():
+            counts = self.references.get_obj()
+            if self.generations.get_obj()[slot] == generation and counts[slot] > 0:
+                counts[slot] -= 1
+
+    def get_references(self, slot: int, generation: int) -> int:
+        # Number of the consumers, which still hold the frame in the slot
+        with self.references.get_lock():
+            if self.generations.get_obj()[slot] != generation:
+                return 0
+            return self.references.get_obj()[slot]
+
+    def view(self, slot: int) -> np.ndarray:
+        return self.attach()[slot]
+
+    def occupancy(self) -> int:
+        with self.references.get_lock():
+            return sum(1 for references in self.references.get_obj() if references > 0)
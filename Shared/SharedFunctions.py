@@ -26,6 +26,11 @@ class SharedFunctions(object):
         camera_time: float = camera_timestamp / 1000
         return time.localtime(start_of_capture + camera_time)
 
+    @staticmethod
+    def get_capture_time(start_of_capture: float, camera_timestamp: float) -> int:
+        # Camera time expressed in milliseconds
+        return int(start_of_capture * 1000 + camera_timestamp)
+
     @staticmethod
     def get_output_video(root_path: str, playground: int, planned_start_time: float):
         return os.path\
@@ -101,6 +106,30 @@ class SharedFunctions(object):
             contours.append([int(p.x * ratio), int(p.y * ratio)])
         return contours
 
+    @staticmethod
+    def is_idle(last_job: float, end_of_capture: float, timeout: float, now: float = None) -> bool:
+        # Consumer gives up waiting only after the capture has ended. Until then, the end is signalled by None,
+        # since the cameras might send nothing for a long time, e.g. while their scene is still.
+        if now is None:
+            now = time.time()
+        return now - max(last_job, end_of_capture) > timeout
+
+    @staticmethod
+    def get_config_choice(value: str, choices: List[str], description: str) -> str:
+        # Configured value is one of the named constants, case and surrounding spaces don't matter
+        choice = value.strip().lower()
+        if choice not in choices:
+            raise ValueError("Unknown {} {}. Expected one of {}.".format(description, value, ", ".join(choices)))
+        return choice
+
+    @staticmethod
+    def get_frame_size(value: str) -> (int, int):
+        # Frame size is configured as "width,height", and empty value means that the frame is not resized
+        if value is None or value.strip() == "":
+            return None
+        width, height = value.split(",")
+        return int(width), int(height)
+
     @staticmethod
     def planned_start_time(hour: int, minute: int):
         today = datetime.datetime.now()
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+from Shared.SharedFunctions import SharedFunctions
+
+
+class StreamingMode(object):
+    # Only the MP4 file, which is playable once the recording is finished
+    NONE: str = "none"
+    # Fragmented MP4 file, which is playable while it is still being written
+    FMP4: str = "fmp4"
+    # HLS segments with a rolling playlist
+    HLS: str = "hls"
+
+    MODES = [NONE, FMP4, HLS]
+
+    @staticmethod
+    def from_config(value: str) -> str:
+        return SharedFunctions.get_config_choice(value, StreamingMode.MODES, "streaming mode")
@@ -1,5 +1,16 @@
 #!/usr/bin/env python3
+import numpy
+
+
 class YoloDetection(object):
+    # Compact record of the detection, returned by the vectorised detection parsing
+    DTYPE = numpy.dtype([("class_id", numpy.int32),
+                         ("confidence", numpy.float32),
+                         ("left", numpy.float32),
+                         ("top", numpy.float32),
+                         ("width", numpy.float32),
+                         ("height", numpy.float32)])
+
     def __init__(self, class_id, class_name, confidence, left, top, width, height):
         self.ClassName: str = class_name
         self.ClassID: int = class_id
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+import cv2
+import numpy as np
+from typing import List, Dict
+from Shared.Detection import Detection
+from Shared.DefinedPolygon import DefinedPolygon
+from Shared.SharedFunctions import SharedFunctions
+
+
+class ZoneMask(object):
+    """
+    Polygons of each camera, rasterised once into the detection and protected area masks,
+    in the 480x270 space of the detections. Each mask is kept as an integral image,
+    so the test whether the ball box overlaps the area is a constant time summed area lookup.
+    """
+    def __init__(self, polygons: List[DefinedPolygon], width: int = 480, height: int = 270):
+        self.width = width
+        self.height = height
+        self.detect_masks: Dict[int, np.ndarray] = {}
+        self.detect_areas: Dict[int, np.ndarray] = {}
+        self.protected_areas: Dict[int, np.ndarray] = {}
+
+        for camera_id in set(p.camera_id for p in polygons):
+            self.detect_masks[camera_id] = self.rasterise([p for p in polygons
+                                                           if p.camera_id == camera_id and p.detect])
+            self.detect_areas[camera_id] = cv2.integral(self.detect_masks[camera_id])
+            self.protected_areas[camera_id] = cv2.integral(self.rasterise([p for p in polygons
+                                                                           if p.camera_id == camera_id and
+                                                                           not p.detect]))
+
+    def rasterise(self, polygons: List[DefinedPolygon]) -> np.ndarray:
+        mask = np.zeros((self.height, self.width), dtype=np.uint8)
+        for polygon in polygons:
+            points = np.array(SharedFunctions.get_points_array(polygon.points), np.int32)
+            cv2.fillPoly(mask, [points.reshape((-1, 1, 2))], 1)
+        return mask
+
+    def get_detect_mask(self, camera_id: int, size: (int, int)) -> np.ndarray:
+        # Mask of the detection areas at the given (width, height), where 255 marks the area.
+        # Camera without the detection areas is watched as a whole.
+        mask = self.detect_masks.get(camera_id)
+        if mask is None:
+            return np.full((size[1], size[0]), 255, dtype=np.uint8)
+        return cv2.resize(mask * 255, size, interpolation=cv2.INTER_NEAREST)
+
+    def contains_ball(self, ball: Detection) -> bool:
+        # Ball counts, if it overlaps the detection area of its camera, but not its protected area
+        return self.overlaps(self.detect_areas.get(ball.camera_id), ball) and \
+            not self.overlaps(self.protected_areas.get(ball.camera_id), ball)
+
+    def overlaps(self, integral: np.ndarray, ball: Detection) -> bool:
+        if integral is None:
+            return False
+
+        # Box is clipped to the frame, and includes its right and bottom border
+        left = min(max(ball.left, 0), self.width)
+        right = min(max(ball.right + 1, 0), self.width)
+        top = min(max(ball.top, 0), self.height)
+        bottom = min(max(ball.bottom + 1, 0), self.height)
+        if left >= right or top >= bottom:
+            return False
+
+        return integral[bottom, right] - integral[top, right] - integral[bottom, left] + integral[top, left] > 0
@@ -5,8 +5,9 @@ import cv2
 import psutil
 import gc
 from typing import List
-from Darknet import DarknetDetector
+from ActivityDetector.InferenceBackend import InferenceBackend
 from Shared.Configuration import Configuration
+from Shared.InferenceEngine import InferenceEngine
 from Shared.CvFunctions import CvFunctions
 
 
@@ -22,12 +23,17 @@ class DetectorTest(object):
         self.class_names = self.get_class_names()
         self.sports_ball_id = self.class_names.index(self.config.activity_detector["sports-ball"])
 
-        # load the object detection network
-        net = DarknetDetector.DarknetDetector(
+        # load the object detection network, with the engine chosen in the configuration
+        engine = InferenceEngine.from_config(self.config.activity_detector["engine"])
+        net = InferenceBackend.create(
+            engine,
             os.path.join(os.getcwd(), self.config.activity_detector["network-config"]),
             os.path.join(os.getcwd(), self.config.activity_detector["network-weights"]),
             os.path.join(os.getcwd(), self.config.activity_detector["coco-config"]),
-            (480, 270))
+            os.path.join(os.getcwd(), self.config.activity_detector["coco-labels"]),
+            os.path.join(os.getcwd(), self.config.activity_detector["onnx-model"]),
+            (480, 270),
+            1)
 
         started_at = time.time()
         detected_frames = 0
@@ -40,7 +46,7 @@ class DetectorTest(object):
                 if len(detections) > 0:
                     detected_frame = False
                     for detection in detections:
-                        if detection.ClassID == self.sports_ball_id:
+                        if detection["class_id"] == self.sports_ball_id:
                             balls_identified += 1
                             detected_frame = True
 
@@ -52,7 +58,7 @@ class DetectorTest(object):
         CvFunctions.release_open_cv()
         gc.collect()
         print("Memory lost: {}".format(memory_start - psutil.virtual_memory().free))
-        print("GPU utilisation equals {} fps.".format(float(20 / (time.time() - started_at))))
+        print("{} engine utilisation equals {} fps.".format(engine, float(20 / (time.time() - started_at))))
         print("Detected objects: {}".format(balls_identified))
         print("Frames with the ball: {}/{}".format(detected_frames, 20))
 
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+import os
+import time
+import argparse
+import tempfile
+import cv2
+import numpy as np
+from typing import List
+from Shared.EncoderProfile import EncoderProfile
+from VideoMaker.EncoderPipeline import EncoderPipeline
+
+
+class EncoderBenchmark(object):
+    """
+    Pushes synthetic frames through each encoder profile as fast as it takes them,
+    and reports the encoding rate, the CPU used by the process, and the bitrate of the output.
+    """
+    def __init__(self, profiles: List[str], frames: int, width: int, height: int, fps: int, bitrate: int,
+                 x264_preset: str, x264_tune: str, output_directory: str):
+        samples = self.get_samples(width, height, fps)
+        for profile in profiles:
+            pipeline = EncoderPipeline(EncoderProfile.from_config(profile), width, height, fps, bitrate,
+                                       x264_preset, x264_tune)
+            output_video = os.path.join(output_directory, "encoder-benchmark-{}.mp4".format(profile))
+            try:
+                writer = pipeline.open(output_video)
+            except Exception as ex:
+                print("{}: not available ({}).".format(profile, ex))
+                continue
+
+            started_at = time.time()
+            cpu_started_at = time.process_time()
+            for frame_number in range(frames):
+                writer.write(samples[frame_number % len(samples)])
+            # Release waits until the encoder has written the queued frames
+            writer.release()
+            elapsed = time.time() - started_at
+            cpu_time = time.process_time() - cpu_started_at
+
+            size = os.path.getsize(output_video) if os.path.isfile(output_video) else 0
+            print("{}: {:.1f} fps, {:.1f}% of one core, {:.0f} kbit/s, {}".format(
+                profile, frames / elapsed, cpu_time / elapsed * 100, size * 8 / (frames / fps) / 1000,
+                output_video))
+
+    @staticmethod
+    def get_samples(width: int, height: int, fps: int) -> List[np.ndarray]:
+        # Two seconds of a moving gradient with noise, so that the encoder has both motion and detail to encode
+        x = np.linspace(0, 255, width, dtype=np.float32)
+        y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+        random = np.random.default_rng(0)
+        samples = []
+        for i in range(fps * 2):
+            shift = i * 255 / (fps * 2)
+            frame = np.empty((height, width, 3), dtype=np.uint8)
+            frame[:, :, 0] = (x + shift) % 256
+            frame[:, :, 1] = (y + shift) % 256
+            frame[:, :, 2] = random.integers(0, 64, (height, width), dtype=np.uint8)
+            cv2.circle(frame, (int(width * i / (fps * 2)), height // 2), height // 20, (255, 255, 255), -1)
+            samples.append(frame)
+        return samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Encoder profile benchmark")
+    parser.add_argument("--profiles", type=str, default=",".join(EncoderProfile.PROFILES),
+                        help="Comma separated encoder profiles to measure.")
+    parser.add_argument("--frames", type=int, default=500, help="Number of frames written by each profile.")
+    parser.add_argument("--width", type=int, default=1920, help="Width of the frames.")
+    parser.add_argument("--height", type=int, default=1080, help="Height of the frames.")
+    parser.add_argument("--fps", type=int, default=22, help="Frame rate of the output video.")
+    parser.add_argument("--bitrate", type=int, default=8000, help="Bitrate of the output video in kbit/s.")
+    parser.add_argument("--x264-preset", type=str, default="veryfast", help="Speed preset of the x264 encoder.")
+    parser.add_argument("--x264-tune", type=str, default="zerolatency", help="Tuning of the x264 encoder.")
+    parser.add_argument("--output", type=str, default=tempfile.gettempdir(), help="Directory of the output videos.")
+    opt = parser.parse_args()
+    EncoderBenchmark(opt.profiles.split(","), opt.frames, opt.width, opt.height, opt.fps, opt.bitrate,
+                     opt.x264_preset, opt.x264_tune, opt.output)
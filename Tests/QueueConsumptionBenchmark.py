@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import time
+import queue
+import argparse
+import multiprocessing as mp
+
+
+class QueueConsumptionBenchmark(object):
+    """
+    Compares the CPU time used by a consumer which polls the queue with qsize(),
+    with the consumer which blocks on the queue with timeout, while frames arrive at the camera rate.
+    """
+    def __init__(self, seconds: int, fps: int, cameras: int):
+        for mode in ["polling", "blocking"]:
+            frame_queue = mp.Queue(200)
+            result_queue = mp.Queue()
+            consumer = mp.Process(target=self.consume, args=(mode, frame_queue, result_queue))
+            consumer.start()
+
+            started_at = time.time()
+            frame_number = 0
+            while time.time() - started_at < seconds:
+                for camera_id in range(1, cameras + 1):
+                    frame_queue.put((camera_id, frame_number))
+                frame_number += 1
+                time.sleep(1 / fps)
+            frame_queue.put(None)
+
+            cpu_time, frames = result_queue.get()
+            consumer.join()
+            print("{}: consumed {} frames, using {:.2f} CPU seconds in {} seconds ({:.1f}% of one core).".format(
+                mode, frames, cpu_time, seconds, cpu_time / seconds * 100))
+
+    @staticmethod
+    def consume(mode: str, frame_queue: mp.Queue, result_queue: mp.Queue):
+        frames = 0
+        while True:
+            if mode == "polling":
+                if frame_queue.qsize() > 0:
+                    item = frame_queue.get()
+                else:
+                    continue
+            else:
+                try:
+                    item = frame_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+
+            if item is None:
+                break
+            frames += 1
+
+        result_queue.put((time.process_time(), frames))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Queue consumption CPU benchmark")
+    parser.add_argument("--seconds", type=int, default=10, help="Duration of each run.")
+    parser.add_argument("--fps", type=int, default=22, help="Frames per second of each camera.")
+    parser.add_argument("--cameras", type=int, default=2, help="Number of cameras.")
+    opt = parser.parse_args()
+    QueueConsumptionBenchmark(opt.seconds, opt.fps, opt.cameras)
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+import time
+from Shared.SharedFunctions import SharedFunctions
+
+
+class StillSceneTest(object):
+    """
+    Still scene sends no detection candidates, so the detector workers and Detector get nothing for a long time.
+    They must keep waiting for the end of the cameras, and give up on their own only after the end of capture.
+    """
+    def __init__(self):
+        started_at = time.time()
+        end_of_capture = started_at + 60
+        last_job = started_at + 5
+
+        # The scene is still for 30 seconds, in the middle of the match
+        for seconds in [11, 20, 30]:
+            assert not SharedFunctions.is_idle(last_job, end_of_capture, 10, last_job + seconds), \
+                "Detection ended after {} seconds of the still scene.".format(seconds)
+
+        # After the end of capture, the lost end is waited for 10 seconds only
+        assert not SharedFunctions.is_idle(last_job, end_of_capture, 10, end_of_capture + 5)
+        assert SharedFunctions.is_idle(last_job, end_of_capture, 10, end_of_capture + 11)
+        print("Still scene keeps the detection alive.")
+
+
+if __name__ == "__main__":
+    st = StillSceneTest()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import os
+import cv2
+from Shared.EncoderProfile import EncoderProfile
+from Shared.StreamingMode import StreamingMode
+
+
+class EncoderPipeline(object):
+    """
+    Builds the writer of the output video for the chosen encoder profile.
+    OpenCV hands the frames over as BGR, so they are converted just once, into the format which the encoder takes.
+    The encoded stream can be split into the streaming directory as well, so that the match is playable,
+    while it is still being recorded.
+    """
+    def __init__(self, profile: str, width: int, height: int, fps: int, bitrate: int, x264_preset: str,
+                 x264_tune: str, streaming_mode: str = StreamingMode.NONE, streaming_path: str = None,
+                 segment_duration: int = 4, playlist_length: int = 10, max_files: int = 0):
+        if profile == EncoderProfile.OPENCV and streaming_mode != StreamingMode.NONE:
+            raise ValueError("Encoder profile {} can't stream {}.".format(profile, streaming_mode))
+
+        self.profile = profile
+        self.width = width
+        self.height = height
+        self.fps = fps
+        # Bitrate is expressed in kbit/s
+        self.bitrate = bitrate
+        self.x264_preset = x264_preset
+        self.x264_tune = x264_tune
+        self.streaming_mode = streaming_mode
+        self.streaming_path = streaming_path
+        # Duration of the HLS segments and the MP4 fragments, in seconds
+        self.segment_duration = segment_duration
+        # Number of the segments in the playlist, and on the disk. Zero keeps all of them.
+        self.playlist_length = playlist_length
+        self.max_files = max_files
+
+    def get_pipeline(self, output_video: str) -> str:
+        source = "appsrc ! video/x-raw,format=BGR,width={width},height={height},framerate={fps}/1 ".format(
+            width=self.width, height=self.height, fps=self.fps)
+        return source + self.get_encoder() + self.get_muxer(output_video)
+
+    def get_encoder(self) -> str:
+        if self.profile == EncoderProfile.JETSON:
+            # Videoconvert only adds the alpha channel, the conversion to NV12 runs on the VIC of the board
+            return "! videoconvert " \
+                   "! video/x-raw,format=BGRx " \
+                   "! nvvidconv " \
+                   "! video/x-raw(memory:NVMM),format=NV12 " \
+                   "! nvv4l2h264enc maxperf-enable=true bitrate={bitrate} iframeinterval={keyframes} " \
+                   "! h264parse config-interval=-1 ".format(bitrate=self.bitrate * 1000, keyframes=self.fps * 2)
+        if self.profile == EncoderProfile.X264:
+            return "! videoconvert " \
+                   "! video/x-raw,format=I420 " \
+                   "! x264enc speed-preset={preset} tune={tune} bitrate={bitrate} key-int-max={keyframes} " \
+                   "! h264parse config-interval=-1 ".format(preset=self.x264_preset,
+                                         tune=self.x264_tune,
+                                         bitrate=self.bitrate,
+                                         keyframes=self.fps * 2)
+        raise ValueError("Encoder profile {} has no GStreamer pipeline.".format(self.profile))
+
+    def get_muxer(self, output_video: str) -> str:
+        muxer = "qtmux ! filesink location={video}".format(video=output_video)
+        if self.streaming_mode == StreamingMode.NONE:
+            return "! " + muxer
+
+        # The stream is encoded once, and split between the video file and the streaming directory.
+        # Each branch parses the stream on its own, since qtmux takes the avc format and mpegtsmux of hlssink2
+        # the byte-stream, which a single parser in front of the tee couldn't negotiate.
+        return "! tee name=encoded " \
+               "! queue ! h264parse ! {muxer} " \
+               "encoded. ! queue ! h264parse ! {stream}".format(muxer=muxer, stream=self.get_stream(output_video))
+
+    def get_stream(self, output_video: str) -> str:
+        # Stream files are named after the video
+        name = os.path.splitext(os.path.basename(output_video))[0]
+        if self.streaming_mode == StreamingMode.FMP4:
+            # Each fragment is written as soon as it is complete, so the file doesn't wait for the moov atom
+            return "mp4mux fragment-duration={fragment} streamable=true " \
+                   "! filesink location={location}".format(
+                       fragment=self.segment_duration * 1000,
+                       location=os.path.join(self.streaming_path, "{}.mp4".format(name)))
+
+        # Segments are cut at the key frames, which come every 2 seconds
+        return "hlssink2 location={location} playlist-location={playlist} target-duration={duration} " \
+               "playlist-length={length} max-files={max_files}".format(
+                   location=os.path.join(self.streaming_path, "{}-%05d.ts".format(name)),
+                   playlist=os.path.join(self.streaming_path, "{}.m3u8".format(name)),
+                   duration=self.segment_duration,
+                   length=self.playlist_length,
+                   max_files=self.max_files)
+
+    def open(self, output_video: str) -> cv2.VideoWriter:
+        if self.profile == EncoderProfile.OPENCV:
+            writer = cv2.VideoWriter(output_video,
+                                     cv2.VideoWriter_fourcc(*'mp4v'),
+                                     self.fps,
+                                     (self.width, self.height),
+                                     True)
+        else:
+            writer = cv2.VideoWriter(self.get_pipeline(output_video),
+                                     cv2.CAP_GSTREAMER,
+                                     0,
+                                     self.fps,
+                                     (self.width, self.height),
+                                     True)
+
+        # Writer which failed to open would silently drop every frame
+        if not writer.isOpened():
+            raise RuntimeError("Encoder profile {} can't write {}.".format(self.profile, output_video))
+        return writer
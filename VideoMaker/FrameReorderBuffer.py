@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+import time
+import heapq
+from typing import List
+from Shared.CapturedFrame import SharedCapturedFrame
+
+
+class FrameReorderBuffer(object):
+    """
+    Delay line of the video frames, ordered by the time they were grabbed, whichever camera they come from.
+    The frame is released once Detector's watermark has passed its timestamp, since no camera switch
+    which happened before the frame can arrive after that. If Detector has nothing to detect, the watermark
+    stalls, and the frame is released once it is older than the hold time.
+    """
+    def __init__(self, hold: float):
+        # Hold time and timestamps are in milliseconds of the monotonic clock
+        self.hold = int(hold * 1000)
+        self.heap = []
+        self.watermark = 0
+        self.released_timestamp = 0
+
+    def push(self, shared_captured_frame: SharedCapturedFrame) -> bool:
+        # Frame which arrives after the later frames were released, can't be put in order anymore
+        if shared_captured_frame.timestamp < self.released_timestamp:
+            return False
+        heapq.heappush(self.heap, (shared_captured_frame.timestamp, shared_captured_frame.camera_id,
+                                   shared_captured_frame.slot, shared_captured_frame))
+        return True
+
+    def set_watermark(self, timestamp: int):
+        self.watermark = max(self.watermark, timestamp)
+
+    def pop_ready(self, flush: bool = False) -> List[SharedCapturedFrame]:
+        ready = []
+        now = int(time.monotonic() * 1000)
+        while len(self.heap) > 0 and (flush or
+                                      self.heap[0][0] <= self.watermark or
+                                      now - self.heap[0][0] >= self.hold):
+            shared_captured_frame = heapq.heappop(self.heap)[3]
+            self.released_timestamp = shared_captured_frame.timestamp
+            ready.append(shared_captured_frame)
+        return ready
+
+    def get_wait_time(self, timeout: float) -> float:
+        # How long to wait for the next frame, before the oldest frame is due, in seconds
+        if len(self.heap) == 0:
+            return timeout
+        return min(max(self.heap[0][0] + self.hold - int(time.monotonic() * 1000), 0) / 1000, timeout)
+
+    def __len__(self):
+        return len(self.heap)
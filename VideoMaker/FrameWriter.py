@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import cv2
+import time
+import queue
+import threading
+from Shared.CapturedFrame import SharedFrameLease
+
+
+class FrameWriter(object):
+    """
+    Encodes the composed frames on a thread of its own, so that the encoder back pressure doesn't stall
+    the video frame queue. OpenCV releases the GIL, while the frame is written, so the next frames are composed
+    in the meantime. Frames stay leased in shared memory, until they are written.
+    """
+    def __init__(self, writer: cv2.VideoWriter, buffer_size: int):
+        self.writer = writer
+        # Small bounded hand-off: when the encoder falls behind, the composing waits, instead of the frames piling up
+        self.frames = queue.Queue(buffer_size)
+        self.time_spent_on_encoding = 0
+        self.encoded_frames = 0
+        self.exception: Exception = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def write(self, captured_frame: SharedFrameLease):
+        # Failure of the encoder is raised in the video maker, the same way as it was written there
+        if self.exception is not None:
+            captured_frame.release()
+            raise self.exception
+        self.frames.put(captured_frame)
+
+    def close(self):
+        # Waits until the frames in the buffer are written
+        if self.thread.is_alive():
+            self.frames.put(None)
+            self.thread.join()
+        if self.exception is not None:
+            raise self.exception
+
+    def qsize(self) -> int:
+        return self.frames.qsize()
+
+    def run(self):
+        while True:
+            captured_frame: SharedFrameLease = self.frames.get()
+            if captured_frame is None:
+                break
+
+            try:
+                # After a failure, the frames are only returned to their rings
+                if self.exception is None:
+                    started = time.time()
+                    self.writer.write(captured_frame.frame)
+                    self.time_spent_on_encoding += time.time() - started
+                    self.encoded_frames += 1
+            except Exception as ex:
+                self.exception = ex
+            finally:
+                captured_frame.release()
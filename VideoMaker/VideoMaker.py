@@ -5,6 +5,7 @@ import numpy as np
 from typing import List
 import os
 import gc
+import queue
 import multiprocessing as mp
 from Shared.CapturedFrame import CapturedFrame, SharedCapturedFrameHandler as sch, SharedCapturedFrame
 from Shared.SharedFunctions import SharedFunctions
@@ -16,18 +17,36 @@ from Shared.RecordScreenInfoOperation import RecordScreenInfoOperation
 from Shared.Configuration import Configuration
 from Shared.LogoRenderer import LogoRenderer
 from Shared.Detection import Detection
+from Shared.SharedFrameRing import SharedFrameRing
+from Shared.Camera import Camera
+from Shared.CameraSwitchTimeline import CameraSwitchTimeline
+from VideoMaker.FrameReorderBuffer import FrameReorderBuffer
+from VideoMaker.FrameWriter import FrameWriter
+from VideoMaker.EncoderPipeline import EncoderPipeline
+from Shared.EncoderProfile import EncoderProfile
+from Shared.StreamingMode import StreamingMode
 
 
 class VideoMaker(object):
+    # How long the video maker blocks on the empty queue, before it checks if it should exit
+    QUEUE_TIMEOUT: float = 0.5
+    # Frames arrive at least the save delay after they were grabbed, and the frames of other cameras
+    # are waited for this much longer (in seconds), when Detector is silent
+    REORDER_MARGIN: float = 0.5
+
     def __init__(self, playground: int, video_frame_queue: mp.Queue, screen_queue: mp.Queue, detection_queue: mp.Queue,
-                 output_video: str, video_latency: float, polygons: List[DefinedPolygon],
-                 width: int, height: int, fps: int, debugging: bool):
+                 output_video: str, streaming_path: str, video_latency: float, polygons: List[DefinedPolygon],
+                 width: int, height: int, fps: int, cameras: List[Camera], frame_rings: List[SharedFrameRing],
+                 debugging: bool):
         self.config = Configuration()
         self.playground = playground
         self.video_frame_queue = video_frame_queue
+        self.cameras = cameras
+        self.frame_rings = frame_rings
         self.screen_queue = screen_queue
         self.detection_queue = detection_queue
         self.output_video = output_video
+        self.streaming_path = streaming_path
         self.video_latency = video_latency
         self.polygons = polygons
         self.width = width
@@ -38,120 +57,88 @@ class VideoMaker(object):
         # We assume that the active camera is 1
         self.active_camera_id = 1
         self.active_detection: Detection = None
+        self.camera_timeline = CameraSwitchTimeline(self.active_camera_id)
+        # Frames of all cameras are put in order, and held until Detector has seen their time
+        self.reorder_buffer = FrameReorderBuffer(video_latency + self.REORDER_MARGIN)
+        self.written_frames = 0
+        self.time_spent_on_composing = 0
+        # Number of composed frames waiting for the encoder
+        self.writer_buffer = int(self.config.video_maker["writer-buffer"])
 
         self.time_format = self.config.common["time-format"]
         self.date_format = self.config.common["date-format"]
         self.resized_overlay_image: np.ndarray = LogoRenderer.get_resized_overlay(
             os.path.join(os.getcwd(), self.config.video_maker["logo-path"]), self.width)
+        self.logo_renderer = LogoRenderer(self.resized_overlay_image, self.date_format, self.time_format)
+        # Encoder and its settings are chosen in the configuration
+        self.encoder_pipeline = EncoderPipeline(EncoderProfile.from_config(self.config.video_maker["encoder"]),
+                                                self.width,
+                                                self.height,
+                                                self.fps,
+                                                int(self.config.video_maker["bitrate"]),
+                                                self.config.video_maker["x264-preset"],
+                                                self.config.video_maker["x264-tune"],
+                                                StreamingMode.from_config(self.config.video_maker["streaming"]),
+                                                self.streaming_path,
+                                                int(self.config.video_maker["streaming-segment-duration"]),
+                                                int(self.config.video_maker["streaming-playlist-length"]),
+                                                int(self.config.video_maker["streaming-max-files"]))
         self.writer = None
+        self.frame_writer: FrameWriter = None
 
     def start(self):
-        output_pipeline = "appsrc " \
-                          "! capsfilter caps='video/x-raw,format=I420,framerate={fps}/1' " \
-                          "! videoconvert " \
-                          "! capsfilter caps='video/x-raw,format=BGRx,interpolation-method=1' " \
-                          "! nvvideoconvert " \
-                          "! capsfilter caps='video/x-raw(memory:NVMM)' " \
-                          "! nvv4l2h264enc maxperf-enable=true " \
-                          "! h264parse " \
-                          "! qtmux " \
-                          "! filesink location={video}".format(width=self.width,
-                                                               height=self.height,
-                                                               fps=self.fps,
-                                                               video=self.output_video)
-
-        if self.debugging:
-            print("gst-launch-1.0 {}".format(output_pipeline))
-
-        self.writer = cv2.VideoWriter(output_pipeline,
-                                      cv2.VideoWriter_fourcc(*'mp4v'),
-                                      self.fps,
-                                      (self.width, self.height),
-                                      True)
-        total_time_spent_on_writes = 0
         try:
-            i = 0
-            written_frames = 0
+            if self.debugging and self.encoder_pipeline.profile != EncoderProfile.OPENCV:
+                print("gst-launch-1.0 {}".format(self.encoder_pipeline.get_pipeline(self.output_video)))
+
+            self.writer = self.encoder_pipeline.open(self.output_video)
+            # Frames are composed here, and encoded by the thread of the frame writer
+            self.frame_writer = FrameWriter(self.writer, self.writer_buffer)
+            self.frame_writer.start()
+
+            self.written_frames = 0
             warmed_up = False
             last_job = time.time()
-            while True:
+            finished = False
+            while not finished:
+                # Wait for the next frame only until the oldest held frame is due
                 try:
-                    if self.video_frame_queue.qsize() > 0:
-                        shared_captured_frame: SharedCapturedFrame = self.video_frame_queue.get()
-                        i += 1
-                        if shared_captured_frame is not None:
-                            # Delay rendering so that Detector can notify VideoMaker a bit earlier,
-                            # before camera has switched
-                            if self.active_detection is not None:
-
-                                p = 0
-                                detection_loop_wait_started = time.time()
-                                detection_loop_warning_displayed = False
-
-                                while self.is_video_ahead(shared_captured_frame, detection_loop_wait_started):
-                                    self.check_active_detection()
-                                    if not detection_loop_warning_displayed:
-                                        print("Frame captured at {}. Waiting 2 seconds".
-                                              format(shared_captured_frame.camera_time))
-                                        detection_loop_warning_displayed = True
-                                        cv2.waitKey(10)
-                                    p += 1
-                                    pass
-
-                            self.check_active_detection()
-
-                            if shared_captured_frame.camera.id == self.active_camera_id:
-                                write_started = time.time()
-                                # get frame from shared memory
-                                captured_frame = sch.get_frame(shared_captured_frame)
-
-                                if self.debugging:
-                                    self.draw_debug_info(captured_frame)
-                                LogoRenderer.draw_logo(captured_frame.frame,
-                                                       self.resized_overlay_image,
-                                                       self.date_format,
-                                                       self.time_format,
-                                                       captured_frame.camera_time)
-                                self.writer.write(captured_frame.frame)
-                                total_time_spent_on_writes += time.time() - write_started
-                                written_frames += 1
-                                captured_frame.release()
-                                if captured_frame.frame_number % self.fps == 0:
-                                    gc.collect()
-
-                                if written_frames % (self.fps * 2) == 0:
-                                    self.screen_queue.put_nowait(
-                                        [RecordScreenInfoEventItem(RecordScreenInfo.VM_IS_LIVE,
-                                                                   RecordScreenInfoOperation.SET,
-                                                                   "yes"),
-                                         RecordScreenInfoEventItem(RecordScreenInfo.VM_QUEUE_COUNT,
-                                                                   RecordScreenInfoOperation.SET,
-                                                                   self.video_frame_queue.qsize()),
-                                         RecordScreenInfoEventItem(
-                                             RecordScreenInfo.VM_WRITTEN_FRAMES,
-                                             RecordScreenInfoOperation.SET,
-                                             written_frames)]
-                                    )
-                            else:
-                                sch.release(shared_captured_frame)
-                        else:
-                            break
-                    else:
-                        # This ensures, that this process exits, if it has processed at least one frame,
-                        # and hasn't got any other during the next 5 seconds.
-                        if warmed_up:
-                            if time.time() - last_job > 5:
-                                break
-                except Exception as ex:
-                    raise ex
+                    shared_captured_frame: SharedCapturedFrame = \
+                        self.video_frame_queue.get(timeout=self.reorder_buffer.get_wait_time(self.QUEUE_TIMEOUT))
+                    received = True
+                except queue.Empty:
+                    received = False
+
+                # Camera switches and the watermark have to be known, before the frames are released
+                self.check_active_detection()
+
+                if received:
+                    last_job = time.time()
+                    warmed_up = True
+                    if shared_captured_frame is None:
+                        finished = True
+                    elif not self.reorder_buffer.push(shared_captured_frame):
+                        # Frame came too late, after the later frames have already been written
+                        sch.release(shared_captured_frame,
+                                    self.frame_rings[shared_captured_frame.camera_id - 1])
+                else:
+                    # This ensures, that this process exits, if it has processed at least one frame,
+                    # and hasn't got any other during the next 5 seconds.
+                    if warmed_up and time.time() - last_job > 5:
+                        finished = True
+
+                for ready_frame in self.reorder_buffer.pop_ready(finished):
+                    self.write_frame(ready_frame)
+
+            self.frame_writer.close()
             self.writer.release()
             self.screen_queue.put_nowait(
                 [RecordScreenInfoEventItem(RecordScreenInfo.CURRENT_TASK,
                                            RecordScreenInfoOperation.SET,
                                            "VideoMaker ended.")])
-            print("TOTAL TIME SPENT ON WRITES {}".format(total_time_spent_on_writes))
+            self.print_time_spent()
         except Exception as ex:
-            print("TOTAL TIME SPENT ON WRITES {}".format(total_time_spent_on_writes))
+            self.print_time_spent()
             print("ERROR OCCURED {}".format(ex))
             self.screen_queue.put_nowait(
                 [RecordScreenInfoEventItem(RecordScreenInfo.VM_EXCEPTIONS,
@@ -167,6 +154,77 @@ class VideoMaker(object):
         finally:
             CvFunctions.release_open_cv()
 
+    def write_frame(self, shared_captured_frame: SharedCapturedFrame):
+        # Camera switches are applied at the time of the frame which caused them,
+        # the same way the camera processes select the frames they send
+        switched_camera_id = self.camera_timeline.camera_at(shared_captured_frame.timestamp)
+        frame_ring = self.frame_rings[shared_captured_frame.camera_id - 1]
+        if shared_captured_frame.camera_id == switched_camera_id:
+            self.active_camera_id = switched_camera_id
+        elif shared_captured_frame.camera_id != self.active_camera_id:
+            sch.release(shared_captured_frame, frame_ring)
+            return
+        # Otherwise the switch arrived later than the camera processes could wait for it. The new camera has
+        # already released the frames before the switch, so the old camera is written, until the new one delivers.
+
+        compose_started = time.time()
+        # Draw the frame in place, straight in shared memory. Frame writer releases it, once it is encoded.
+        captured_frame = sch.lease(shared_captured_frame,
+                                   frame_ring,
+                                   self.cameras[shared_captured_frame.camera_id - 1])
+        try:
+            # The frame which was a detection candidate, might still be read by Detector from the same slot
+            if frame_ring.get_references(shared_captured_frame.slot, shared_captured_frame.generation) > 1:
+                captured_frame.frame = captured_frame.frame.copy()
+            if self.debugging:
+                self.draw_debug_info(captured_frame)
+            self.logo_renderer.draw(captured_frame.frame, captured_frame.camera_time)
+        except Exception:
+            captured_frame.release()
+            raise
+        self.time_spent_on_composing += time.time() - compose_started
+        frame_number = captured_frame.frame_number
+        self.frame_writer.write(captured_frame)
+        self.written_frames += 1
+        if frame_number % self.fps == 0:
+            gc.collect()
+
+        if self.written_frames % (self.fps * 2) == 0:
+            self.screen_queue.put_nowait(
+                [RecordScreenInfoEventItem(RecordScreenInfo.VM_IS_LIVE,
+                                           RecordScreenInfoOperation.SET,
+                                           "yes"),
+                 RecordScreenInfoEventItem(RecordScreenInfo.VM_QUEUE_COUNT,
+                                           RecordScreenInfoOperation.SET,
+                                           self.video_frame_queue.qsize()),
+                 RecordScreenInfoEventItem(
+                     RecordScreenInfo.VM_WRITTEN_FRAMES,
+                     RecordScreenInfoOperation.SET,
+                     self.written_frames),
+                 RecordScreenInfoEventItem(RecordScreenInfo.VM_COMPOSE_TIME,
+                                           RecordScreenInfoOperation.SET,
+                                           self.get_compose_time()),
+                 RecordScreenInfoEventItem(RecordScreenInfo.VM_ENCODE_TIME,
+                                           RecordScreenInfoOperation.SET,
+                                           self.get_encode_time()),
+                 RecordScreenInfoEventItem(RecordScreenInfo.VM_WRITER_QUEUE_COUNT,
+                                           RecordScreenInfoOperation.SET,
+                                           self.frame_writer.qsize())]
+            )
+
+    def get_compose_time(self) -> float:
+        # Average time in milliseconds, which the frame spends on drawing
+        return round(self.time_spent_on_composing * 1000 / max(self.written_frames, 1), 2)
+
+    def get_encode_time(self) -> float:
+        # Average time in milliseconds, which the frame spends in the encoder
+        return round(self.frame_writer.time_spent_on_encoding * 1000 / max(self.frame_writer.encoded_frames, 1), 2)
+
+    def print_time_spent(self):
+        print("TOTAL TIME SPENT ON COMPOSING {}".format(self.time_spent_on_composing))
+        if self.frame_writer is not None:
+            print("TOTAL TIME SPENT ON ENCODING {}".format(self.frame_writer.time_spent_on_encoding))
+
     def draw_debug_info(self, captured_frame: CapturedFrame):
         # Draw protected area first
         for polygon_definition in self.polygons:
@@ -190,16 +248,16 @@ class VideoMaker(object):
                     (10, 500), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 2, cv2.LINE_AA)
 
     def check_active_detection(self):
-        # Check if there is a message from Detector that active camera has changed
-        try:
-            if self.detection_queue.qsize() > 0:
-                self.active_detection = self.detection_queue.get()
-                self.active_camera_id = self.active_detection.camera_id
-        except Exception as ex:
-            raise ex
-        finally:
-            pass
+        # Detector sends the camera switches, and after each detected frame, its timestamp as the watermark.
+        # Both come through the same queue, so the switch always arrives before the watermark which covers it.
+        while True:
+            try:
+                message = self.detection_queue.get_nowait()
+            except queue.Empty:
+                break
 
-    def is_video_ahead(self, shared_captured_frame: SharedCapturedFrame, detection_loop_wait_started: time):
-        return time.mktime(shared_captured_frame.camera_time) > self.active_detection.camera_time and \
-               (time.time() - detection_loop_wait_started) < 2
+            if isinstance(message, Detection):
+                self.active_detection = message
+                self.camera_timeline.add(self.active_detection)
+            else:
+                self.reorder_buffer.set_watermark(message)